@@ -0,0 +1,107 @@
+from datetime import date
+import io
+import json
+import pathlib
+
+import pytest
+
+from vmapplet.cli import main, _parse_overrides, _parse_seeds
+from vmapplet.tools.file_tools import get_shared_data_path
+
+
+def test_parse():
+    assert _parse_seeds(["1", "5:8"]) == [1, 5, 6, 7]
+    assert _parse_overrides(
+        ["general.date_end=1994-05-20", "wood.youngs_modulus = 1.2", "a.b=c"]
+    ) == {
+        "general.date_end": date(1994, 5, 20),
+        "wood.youngs_modulus": 1.2,
+        "a.b": "c",
+    }
+
+
+def test_run(tmp_path):
+    config = get_shared_data_path("simulation.toml")
+    overrides = [
+        "--set",
+        "general.date_start=1994-05-10",
+        "--set",
+        "general.date_end=1994-05-20",
+    ]
+
+    # legacy form without the run command
+    assert main([config, str(tmp_path), *overrides, "--checkpoint-every", "5"]) == 0
+    assert (tmp_path / "checkpoint.pickle").exists()
+
+    assert (
+        main(
+            [
+                "run",
+                "--restore",
+                str(tmp_path / "checkpoint.pickle"),
+                str(tmp_path / "restored"),
+                "--set",
+                "general.date_end=1994-05-25",
+            ]
+        )
+        == 0
+    )
+
+
+def test_run_render_on_change(tmp_path):
+    config = get_shared_data_path("simulation.toml")
+    assert (
+        main(
+            [
+                "run",
+                config,
+                str(tmp_path),
+                "--set",
+                "general.date_start=1994-05-10",
+                "--set",
+                "general.date_end=1994-05-13",
+                "--render-on-change",
+            ]
+        )
+        == 0
+    )
+    assert len(list(tmp_path.glob("*.bgeom"))) > 0
+
+
+def test_profile(tmp_path, capsys):
+    config = get_shared_data_path("simulation.toml")
+    assert (
+        main(
+            [
+                "profile",
+                config,
+                str(tmp_path / "output"),
+                "--set",
+                "general.date_start=1994-05-10",
+                "--set",
+                "general.date_end=1994-05-13",
+                "--stats",
+                str(tmp_path),
+                "--top",
+                "5",
+            ]
+        )
+        == 0
+    )
+    assert (tmp_path / "run.pstats").exists()
+    with io.open(tmp_path / "phases.json") as file:
+        phases = json.load(file)
+    assert phases["mechanics"] == pytest.approx(
+        sum(v for k, v in phases.items() if k.startswith("mechanics/"))
+    )
+    assert "structure" in phases and "interpretation" in phases
+    assert "# phases" in capsys.readouterr().out
+
+
+def test_compile(tmp_path):
+    markov_path = pathlib.Path(get_shared_data_path("markov"))
+    for path in markov_path.glob("*.toml"):
+        (tmp_path / path.name).write_bytes(path.read_bytes())
+
+    assert main(["compile", str(tmp_path)]) == 0
+    assert len(list(tmp_path.glob("*.npz"))) == len(list(markov_path.glob("*.toml")))
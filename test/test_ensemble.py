@@ -0,0 +1,25 @@
+from datetime import date
+import io
+
+import pytest
+
+from vmapplet import Options, run_ensemble
+from vmapplet.tools.file_tools import get_shared_data_path
+
+
+def test_run_ensemble(tmp_path):
+    with io.open(get_shared_data_path("simulation.toml")) as file:
+        options = Options.loads(file.read())
+    options.general.date_start = date(1994, 5, 1)
+    options.general.date_end = date(1994, 5, 4)
+
+    infos = run_ensemble(options, range(3), str(tmp_path), workers=2)
+
+    assert [info.seed for info in infos] == [0, 1, 2]
+    for info in infos:
+        assert info.error is None
+        assert info.days == 3
+    assert (tmp_path / "runs.toml").exists()
+
+    with pytest.raises(ValueError):
+        run_ensemble(options, [1, 1], str(tmp_path))
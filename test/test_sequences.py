@@ -1,4 +1,10 @@
+import io
+import pathlib
+import warnings
+
+import numpy as np
 import pytest
+import toml
 
 from vmapplet.sequences import (
     Markov,
@@ -10,6 +16,14 @@ from vmapplet.sequences import (
     _non_parametric_distribution,
 )
 from vmapplet.enums import Observation
+from vmapplet.markov import (
+    MarkovModel,
+    SequencePool,
+    compile_models,
+    load_model,
+    load_models,
+)
+from vmapplet.tools.file_tools import get_shared_data_path
 
 
 def test_terminal_fate():
@@ -29,6 +43,11 @@ def test_generate_trunk():
         seq = generate_trunk()
         assert len(seq) == 4
 
+    # a new list from the cached sequences
+    seq.pop()
+    assert generate_trunk(select=[1]) == [(None, 1)] * 4
+    assert len(generate_trunk()) == 4
+
 
 def test_generate_random_draw_sequence():
     seq = _generate_random_draw_sequence()
@@ -60,3 +79,155 @@ def test_non_parametric_distribution():
 def test_markov():
     markov = Markov()
     assert markov.maximum_length == 70
+
+
+def _markov_model(name: str) -> MarkovModel:
+    with io.open(pathlib.Path(get_shared_data_path("markov")) / name) as file:
+        return MarkovModel(**toml.loads(file.read()))
+
+
+def test_markov_alias():
+    model = _markov_model("fuji_long_year_1.toml")
+
+    # the last observation has probability 0 in state 2
+    rng = np.random.default_rng(0)
+    draws = model.draw_observations(2, 100000, rng)
+    frequencies = np.bincount(draws, minlength=6) / 100000
+    assert np.allclose(frequencies, model.observation_distributions[2], atol=0.01)
+    assert frequencies[5] == 0
+
+    draws = [model.draw_transition(2, rng) for _ in range(10000)]
+    frequencies = np.bincount(draws, minlength=7) / 10000
+    assert np.allclose(frequencies, model.transition_probabilities[2], atol=0.02)
+    assert np.all(frequencies[model.transition_probabilities[2] == 0] == 0)
+    assert all(model.draw_initial(rng) == 0 for _ in range(100))
+
+
+def test_markov_sequence():
+    model = _markov_model("fuji_long_year_3.toml")
+    markov = Markov(np.random.default_rng(0)).set_models(medium=model, long=model)
+    for _ in range(20):
+        sequence = markov.generate_bounded_long_sequence(15, 26)
+        assert 15 <= len(sequence) <= 26
+        assert all(type(state) is int and type(obs) is int for state, obs in sequence)
+
+
+def test_markov_exact():
+    model = _markov_model("fuji_long_year_4.toml")
+    _, lengths, _ = model.length_probabilities(301)
+    assert np.isclose(model.initial_probabilities[:-1] @ lengths.sum(axis=1), 1.0)
+
+    samples = dict()
+    for exact in (False, True):
+        markov = Markov(np.random.default_rng(0), exact=exact)
+        markov.set_models(medium=model, long=model)
+        samples[exact] = [
+            markov.generate_bounded_long_sequence(41, 70) for _ in range(500)
+        ]
+        assert all(41 <= len(sequence) <= 70 for sequence in samples[exact])
+
+    # the same distribution of lengths and states
+    for statistic in (len, lambda sequence: sum(s == 3 for s, _ in sequence)):
+        rejected, exact = (
+            np.array([statistic(sequence) for sequence in samples[exact]])
+            for exact in (False, True)
+        )
+        error = np.sqrt((rejected.var() + exact.var()) / 500)
+        assert abs(rejected.mean() - exact.mean()) < 4 * error
+
+
+def test_sequence_pool():
+    medium = _markov_model("fuji_long_year_3.toml")
+    long = _markov_model("fuji_long_year_4.toml")
+
+    def markov() -> Markov:
+        markov = Markov(np.random.default_rng(0)).set_models(medium=medium, long=long)
+        return markov.set_pool(SequencePool(markov, seed=1, size=4))
+
+    def draw(markov: Markov, refill: bool) -> list:
+        sequences = []
+        for _ in range(10):
+            sequences.append(markov.generate_bounded_long_sequence(26, 41))
+            sequences.append(markov.generate_bounded_medium_sequence(15, 26))
+            if refill:
+                markov.pool.refill()
+        return sequences
+
+    # independent of when the buffers are filled
+    assert draw(markov(), False) == draw(markov(), True)
+
+    first = markov()
+    draw(first, False)
+    second = markov()
+    second.pool.set_state(first.pool.get_state())
+    assert draw(first, True) == draw(second, False)
+
+
+def test_markov_occupancies():
+    model = _markov_model("fuji_medium_year_3.toml")
+    rng = np.random.default_rng(0)
+    # a single binomial trial is never within the bounds [4, 6] of state 3
+    assert model.draw_occupancies([0, 3], rng) is None
+    occupancies = model.draw_occupancies([0] * 1000, rng)
+    assert min(occupancies) >= 2
+
+    markov = Markov(rng).set_models(medium=model, long=model)
+    for _ in range(100):
+        assert 5 <= len(markov.generate_bounded_medium_sequence(5, 15)) <= 15
+
+
+def test_markov_stats():
+    model = _markov_model("fuji_long_year_4.toml")
+    for exact in (False, True):
+        markov = Markov(np.random.default_rng(0), exact=exact)
+        markov.set_models(medium=model, long=model)
+        for _ in range(20):
+            markov.generate_bounded_long_sequence(41, 70)
+
+        stats = markov.stats[(4, "LONG", 41, 70)]
+        assert stats.calls == 20
+        assert sum(stats.histogram.values()) == 20
+        assert stats.iterations == 20 if exact else stats.iterations > 20
+        assert stats.failures == 0
+        assert stats.max_seconds > 0
+
+
+def test_load_model(tmp_path):
+    path = pathlib.Path(get_shared_data_path("markov")) / "fuji_long_year_4.toml"
+    model = load_model(path)
+    assert load_model(path) is model
+    assert not model.transition_probabilities.flags.writeable
+
+    (tmp_path / "fuji_long_year_4.toml").write_bytes(path.read_bytes())
+    assert compile_models(tmp_path) == [tmp_path / "fuji_long_year_4.npz"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        models = load_models(tmp_path)
+    compiled = models[("LONG", 4)]
+    assert compiled is not model
+    assert compiled.year == 4 and compiled.length == "LONG"
+    assert np.array_equal(
+        compiled.observation_distributions, model.observation_distributions
+    )
+    assert compiled.occupancy_distributions == model.occupancy_distributions
+
+    # the .toml changed after it was compiled
+    with io.open(tmp_path / "fuji_long_year_4.toml", "a") as file:
+        file.write("# edited\n")
+    with pytest.warns(UserWarning, match="out of date"):
+        stale = load_models(tmp_path)[("LONG", 4)]
+    assert stale is not compiled
+    assert np.array_equal(
+        stale.transition_probabilities, model.transition_probabilities
+    )
+
+    # the same sequences for the same seed
+    sequences = []
+    for m in (model, compiled):
+        for exact in (False, True):
+            markov = Markov(np.random.default_rng(0), exact=exact)
+            markov.set_models(medium=m, long=m)
+            sequences.append(
+                [markov.generate_bounded_long_sequence(26, 41) for _ in range(10)]
+            )
+    assert sequences[:2] == sequences[2:]
@@ -0,0 +1,504 @@
+from datetime import date
+import asyncio
+import csv
+import io
+import multiprocessing
+import pathlib
+import random
+import threading
+
+import pytest
+
+from vmapplet import Simulation, Options, RenderPolicy, run, run_async, run_scenarios
+from vmapplet.ensemble import summarize
+from vmapplet.markov import compile_models
+from vmapplet.tools.file_tools import get_shared_data_path
+
+
+def _options() -> Options:
+    with io.open(get_shared_data_path("simulation.toml")) as file:
+        options = Options.loads(file.read())
+    options.general.date_start = date(1994, 5, 10)
+    options.general.date_end = date(1994, 6, 30)
+    options.output.dates = []
+    return options
+
+
+@pytest.mark.parametrize("skip_unchanged_mechanics", [False, True])
+def test_checkpoint_restore(tmp_path, skip_unchanged_mechanics):
+    options = _options()
+    if skip_unchanged_mechanics:
+        # the mechanics settle and are skipped in winter
+        options.general.date_start = date(1994, 12, 20)
+        options.general.date_end = date(1995, 1, 20)
+        options.general.skip_unchanged_mechanics = True
+    simulation = Simulation(options, str(tmp_path))
+    for _ in range(3):
+        simulation.advance()
+    simulation.checkpoint(tmp_path / "checkpoint.pickle")
+    for _ in range(10):
+        simulation.advance()
+    expected = (
+        summarize(simulation),
+        simulation._lsystems.get_derivation_steps(),
+        random.random(),
+        simulation.date,
+    )
+
+    restored = Simulation.restore(tmp_path / "checkpoint.pickle")
+    for _ in range(10):
+        restored.advance()
+
+    assert (
+        summarize(restored),
+        restored._lsystems.get_derivation_steps(),
+        random.random(),
+        restored.date,
+    ) == expected
+
+
+def test_apply_options():
+    simulation = Simulation(_options())
+    simulation.apply_options({"wood.youngs_modulus": 2.0, "tree.branching_angle": 30})
+    assert simulation.wood._youngs_modulus == 2.0e9
+    assert simulation.tree.growth_units == 0
+    assert simulation.tree.branching_angle < 0.53
+
+    simulation.apply_options({"markov.pool_size": 8, "general.fused": False})
+    assert simulation._markov.pool is not None
+
+
+def test_apply_options_markov_path(tmp_path):
+    simulation = Simulation(_options())
+    default = simulation._markov_models
+    for path in pathlib.Path(get_shared_data_path("markov")).glob("*.toml"):
+        (tmp_path / path.name).write_bytes(path.read_bytes())
+    compile_models(tmp_path)
+
+    simulation.apply_options({"input.markov_path": str(tmp_path)})
+    simulation.advance()
+    models = simulation._markov_models
+    assert models.keys() == default.keys()
+    assert all(models[key] is not default[key] for key in models)
+    assert any(simulation._markov._long is model for model in models.values())
+
+
+def test_apply_options_fixed():
+    simulation = Simulation(_options())
+    with pytest.raises(ValueError, match="general.fused, input.lpy_path"):
+        simulation.apply_options(
+            {
+                "wood.youngs_modulus": 2.0,
+                "general.fused": True,
+                "input.lpy_path": "lpy",
+            }
+        )
+    with pytest.raises(ValueError, match="output.trace"):
+        simulation.apply_options({"output.trace": "trace.jsonl"})
+    with pytest.raises(ValueError, match="maximum steps"):
+        simulation.apply_options({"general.convergence_maximum_steps": 0})
+    assert simulation.options.wood.youngs_modulus == 1.1
+    assert simulation.options.general.fused is False
+    assert simulation.options.general.convergence_maximum_steps == 10
+
+
+@pytest.mark.parametrize("fork", [True, False])
+def test_run_scenarios(tmp_path, monkeypatch, fork):
+    if fork and "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("no 'fork' start method")
+    if not fork:
+        monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    options = _options()
+    options.general.date_end = date(1994, 5, 20)
+    simulation = Simulation(options, str(tmp_path))
+    for _ in range(3):
+        simulation.advance()
+
+    infos = run_scenarios(
+        simulation,
+        {"soft": {"wood.youngs_modulus": 0.8}, "hard": {"wood.youngs_modulus": 1.4}},
+        str(tmp_path),
+        workers=2,
+    )
+
+    assert [info.name for info in infos] == ["soft", "hard"]
+    for info in infos:
+        assert info.error is None
+        assert info.days == 10
+    assert not (tmp_path / "prefix.pickle").exists()
+
+
+def test_fast_forward():
+    options = _options()
+    options.general.date_start = date(1994, 12, 20)
+    options.general.date_end = date(1995, 5, 20)
+    options.general.fast_forward = True
+    simulation = Simulation(options)
+
+    advances = 0
+    while simulation.date < simulation.ending_date:
+        simulation.advance()
+        advances += 1
+
+    assert simulation.date == simulation.ending_date
+    assert simulation.time_elapsed.days == 151
+    assert advances < 30
+    assert simulation.dt.days == 1
+
+
+def test_time_steps():
+    options = _options()
+    options.general.time_steps = [
+        dict(day=20, month=5, dt=7),
+        dict(day=15, month=6, dt=1),
+    ]
+    simulation = Simulation(options)
+
+    dates = []
+    while simulation.date < simulation.ending_date:
+        simulation.advance()
+        dates.append(simulation.date.date())
+
+    assert simulation.date == simulation.ending_date
+    assert date(1994, 5, 20) in dates
+    assert date(1994, 6, 15) in dates
+    assert date(1994, 5, 21) not in dates
+    assert len(dates) < 51
+
+
+def test_time_steps_events():
+    options = _options()
+    options.general.date_start = date(1994, 10, 1)
+    options.general.date_end = date(1994, 12, 31)
+    options.general.time_steps = [dict(day=1, month=1, dt=7)]
+    simulation = Simulation(options)
+
+    dates = [simulation.date.date()]
+    while simulation.date < simulation.ending_date:
+        simulation.advance()
+        dates.append(simulation.date.date())
+
+    steps = {end: (end - start).days for start, end in zip(dates, dates[1:])}
+    assert max(steps.values()) == 7
+    # daily steps during leaf fall
+    assert all(
+        days == 1
+        for end, days in steps.items()
+        if date(1994, 11, 16) <= end <= date(1994, 12, 29)
+    )
+
+
+def test_run_async():
+    options = _options()
+    options.general.date_end = date(1994, 5, 20)
+    simulation = Simulation(options)
+    progress = []
+
+    asyncio.run(run_async(simulation, on_progress=progress.append))
+
+    assert simulation.date == simulation.ending_date
+    assert [p.days for p in progress] == list(range(1, 11))
+    assert progress[-1].total_days == 10
+    assert progress[-1].metamers == summarize(simulation)["metamers"]
+
+
+def test_run_async_scene(monkeypatch):
+    options = _options()
+    options.general.date_end = date(1994, 5, 13)
+    simulation = Simulation(options)
+    threads = dict(scene=set(), widget=set())
+    get_scene = Simulation.get_scene
+
+    def scene(self):
+        threads["scene"].add(threading.get_ident())
+        return get_scene(self)
+
+    class SceneWidget:
+        def set_scenes(self, scene, scales):
+            threads["widget"].add(threading.get_ident())
+
+    monkeypatch.setattr(Simulation, "get_scene", scene)
+
+    async def main():
+        await run_async(simulation, scene_widget=SceneWidget())
+        return threading.get_ident()
+
+    loop = asyncio.run(main())
+
+    # the scene is built in the executor, only shown on the event loop
+    assert threads["widget"] == {loop}
+    assert threads["scene"] and loop not in threads["scene"]
+
+
+def test_run_async_cancel():
+    simulation = Simulation(_options())
+    progress = []
+
+    async def main():
+        async def on_progress(p):
+            progress.append(p)
+            if len(progress) == 3:
+                task.cancel()
+
+        task = asyncio.create_task(run_async(simulation, on_progress=on_progress))
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    assert simulation.time_elapsed.days == 3
+
+
+def test_trace(tmp_path):
+    options = _options()
+    options.general.date_end = date(1994, 5, 13)
+    options.output.trace = "trace.csv"
+    simulation = Simulation(options, str(tmp_path))
+    for _ in range(3):
+        simulation.advance()
+
+    with io.open(tmp_path / "trace.csv") as file:
+        rows = list(csv.DictReader(file))
+
+    lsystems = [row["lsystem"] for row in rows if row["date"] == "1994-05-11"]
+    assert "mechanics/backward" in lsystems
+    assert "structure" in lsystems
+    assert len(rows) == 3 * len(lsystems)
+    assert int(rows[-1]["metamer"]) == summarize(simulation)["metamers"]
+
+
+def test_render_policy():
+    class SceneWidget:
+        renders = 0
+
+        def set_scenes(self, scene, scales):
+            self.renders += 1
+
+    options = _options()
+    options.general.date_end = date(1994, 5, 20)
+    scene_widget = SceneWidget()
+
+    run(Simulation(options), scene_widget, RenderPolicy(every=4))
+
+    assert scene_widget.renders == 3
+
+
+def test_fused():
+    options = _options()
+    options.general.date_end = date(1994, 5, 25)
+    simulation = Simulation(options)
+    run(simulation)
+
+    options = _options()
+    options.general.date_end = date(1994, 5, 25)
+    options.general.fused = True
+    fused = Simulation(options)
+    run(fused)
+
+    assert summarize(fused) == summarize(simulation)
+    assert [m.name for m in fused.lstring] == [m.name for m in simulation.lstring]
+
+
+def test_adaptive_convergence():
+    options = _options()
+    options.general.date_end = date(1994, 5, 20)
+    options.general.convergence_tolerance = 1e-6
+    options.general.convergence_maximum_steps = 5
+    simulation = Simulation(options)
+
+    iterations = []
+    while simulation.date < simulation.ending_date:
+        simulation.advance()
+        iterations.append(simulation.convergence_iterations)
+
+    assert all(1 <= i <= 5 for i in iterations)
+
+    options.general.convergence_maximum_steps = 0
+    with pytest.raises(ValueError, match="maximum steps"):
+        Simulation(options)
+
+
+def test_apex_expansion_convergence():
+    radii = []
+    for tolerance, maximum_steps in ((0.0, 10), (1e-6, 10), (1e-3, 3)):
+        options = _options()
+        options.general.date_end = date(1994, 5, 25)
+        options.general.convergence_tolerance = tolerance
+        options.general.convergence_maximum_steps = maximum_steps
+        simulation = Simulation(options)
+        run(simulation)
+        radii.append(
+            [module[0].radius for module in simulation.lstring if module.name == "apex"]
+        )
+
+    assert radii[0]
+    assert radii[0] == radii[1] == radii[2]
+
+
+def test_skip_unchanged_mechanics():
+    options = _options()
+    options.general.date_start = date(1994, 12, 20)
+    options.general.date_end = date(1995, 1, 20)
+    options.general.skip_unchanged_mechanics = True
+    simulation = Simulation(options)
+
+    derived = []
+    while simulation.date < simulation.ending_date:
+        step = simulation._lsystems.get_derivation_steps()[1][0]
+        simulation.advance()
+        derived.append(simulation._lsystems.get_derivation_steps()[1][0] > step)
+
+    assert derived[0]
+    assert not derived[-1]
+
+
+def test_skip_unchanged_mechanics_autumn():
+    options = _options()
+    options.general.date_start = date(1994, 11, 1)
+    options.general.date_end = date(1994, 12, 31)
+    options.general.skip_unchanged_mechanics = True
+    simulation = Simulation(options)
+
+    skipped = 0
+    while simulation.date < simulation.ending_date:
+        step = simulation._lsystems.get_derivation_steps()[1][0]
+        simulation.advance()
+        skipped += simulation._lsystems.get_derivation_steps()[1][0] == step
+
+    # autumn (60 days) and leaf fall (45 days) do not keep the mechanics from being
+    # skipped
+    assert skipped > 30
+
+
+def test_lean_lstrings():
+    options = _options()
+    options.general.date_end = date(1994, 5, 15)
+    options.general.lean_lstrings = True
+    simulation = Simulation(options)
+    run(simulation)
+
+    assert list(simulation._lsystems.lstrings.keys()) == ["mechanics", "interpretation"]
+    assert simulation._lsystems.lstrings["interpretation"] is simulation.lstring
+    assert simulation.get_scene() is not None
+
+
+def test_scene_cache():
+    import openalea.plantgl.all as pgl
+
+    options = _options()
+    options.general.date_end = date(1994, 6, 10)
+    options.general.scene_cache = True
+    simulation = Simulation(options)
+    run(simulation)
+
+    cached = simulation.get_scene()
+    assert simulation.get_scene()[1] is cached[1]
+
+    scene = simulation._lsystems.sceneInterpretation()
+    assert len(cached) == len(scene)
+    expected = pgl.BoundingBox(scene)
+    actual = pgl.BoundingBox(cached)
+    assert pgl.norm(actual.lowerLeftCorner - expected.lowerLeftCorner) < 1e-6
+    assert pgl.norm(actual.upperRightCorner - expected.upperRightCorner) < 1e-6
+
+
+@pytest.mark.parametrize("digits", [0, 3])
+def test_scene_cache_growth(digits):
+    import openalea.plantgl.all as pgl
+
+    def boxes(scene):
+        shapes = {}
+        for shape in scene:
+            shapes.setdefault(shape.id, []).append(shape)
+        return {i: pgl.BoundingBox(pgl.Scene(s)) for i, s in shapes.items()}
+
+    options = _options()
+    options.general.date_end = date(1994, 6, 10)
+    options.general.scene_cache = True
+    options.general.scene_cache_digits = digits
+    simulation = Simulation(options)
+    for _ in range(20):
+        simulation.advance()
+    cache = simulation._scene_cache
+    simulation.get_scene()
+    simulation.advance()
+
+    hits, misses = cache.hits, cache.misses
+    scene = simulation.get_scene()
+    hits, misses = cache.hits - hits, cache.misses - misses
+
+    metamers = sum(1 for module in simulation.lstring if module.name == "metamer")
+    assert hits + misses == metamers
+    if digits:
+        # only the metamers that grew or bent visibly are interpreted again
+        assert hits > 0 and misses > 0
+
+    # the shapes of each module match a full interpretation (within the tolerance)
+    expected = boxes(simulation._lsystems.sceneInterpretation())
+    actual = boxes(scene)
+    assert actual.keys() == expected.keys()
+    tolerance = 2 * 10.0**-digits if digits else 1e-9
+    for i, box in expected.items():
+        size = pgl.norm(box.getSize())
+        for corner in ("lowerLeftCorner", "upperRightCorner"):
+            difference = getattr(actual[i], corner) - getattr(box, corner)
+            assert pgl.norm(difference) <= tolerance * size + 1e-9
+
+
+def test_lsystem_cache():
+    import weakref
+
+    def compiled(lsystems):
+        return {
+            id(lsystem)
+            for lsystem in lsystems._lsystems
+            if type(lsystem) is not type(lsystems)
+        } | {
+            i
+            for lsystem in lsystems._lsystems
+            if type(lsystem) is type(lsystems)
+            for i in compiled(lsystem)
+        }
+
+    options = _options()
+    options.general.date_end = date(1994, 5, 25)
+    options.input.lsystem_cache = True
+    first = Simulation(options)
+    run(first)
+    expected = summarize(first)
+    lsystems = compiled(first._lsystems)
+
+    # not shared with a living simulation
+    second = Simulation(options)
+    assert not compiled(second._lsystems) & lsystems
+
+    # released without a garbage collection, including the namespaces of its lsystems
+    tree = weakref.ref(first.tree)
+    del first
+    assert tree() is None
+    third = Simulation(options)
+    assert compiled(third._lsystems) & lsystems
+    run(third)
+    assert summarize(third) == expected
+
+
+def test_markov_stats(tmp_path):
+    import json
+
+    options = _options()
+    options.general.date_end = date(1994, 5, 20)
+    options.output.markov_stats = "markov.json"
+    simulation = Simulation(options, str(tmp_path))
+    run(simulation)
+
+    with io.open(tmp_path / "markov.json") as file:
+        records = json.load(file)
+    assert len(records) == len(simulation.markov_stats)
+    for record in records:
+        key = (
+            record["year"],
+            record["length"],
+            record["lower_bound"],
+            record["upper_bound"],
+        )
+        assert record["calls"] == simulation.markov_stats[key].calls
@@ -0,0 +1,89 @@
+from datetime import date
+import csv
+import io
+
+import pytest
+
+from vmapplet import Options, run_sweep
+from vmapplet.sweep import grid, latin_hypercube
+from vmapplet.tools.file_tools import get_shared_data_path
+
+
+def test_set_field():
+    options = Options()
+    options.set_field("wood.youngs_modulus", 2)
+    assert options.wood.youngs_modulus == 2.0
+    assert type(options.wood.youngs_modulus) is float
+    options.set_field("events.bud_break.day", 20)
+    assert options.get_field("events.bud_break.day") == 20
+    with pytest.raises(KeyError):
+        options.set_field("wood.dummy", 1)
+
+
+def test_grid():
+    samples = grid(
+        {"wood.youngs_modulus": [1.0, 1.1], "tree.branching_angle": range(3)}
+    )
+    assert len(samples) == 6
+    assert samples[-1] == {"wood.youngs_modulus": 1.1, "tree.branching_angle": 2}
+
+
+def test_latin_hypercube():
+    samples = latin_hypercube({"fruit.probability": (0.1, 0.5)}, samples=10)
+    values = sorted(sample["fruit.probability"] for sample in samples)
+    # one sample per stratum
+    for i, value in enumerate(values):
+        assert 0.1 + i * 0.04 <= value <= 0.1 + (i + 1) * 0.04
+
+
+def test_run_sweep(tmp_path):
+    with io.open(get_shared_data_path("simulation.toml")) as file:
+        options = Options.loads(file.read())
+    options.general.date_start = date(1994, 5, 1)
+    options.general.date_end = date(1994, 5, 4)
+    # written to the run directories
+    options.output.dates = [dict(day=3, month=5)]
+    results = tmp_path / "results.csv"
+
+    failures = run_sweep(
+        options,
+        grid({"fruit.probability": [0.1, 0.2]}),
+        str(results),
+        str(tmp_path),
+        workers=2,
+    )
+
+    assert failures == 0
+    with io.open(results) as file:
+        rows = list(csv.DictReader(file))
+    assert sorted(row["fruit.probability"] for row in rows) == ["0.1", "0.2"]
+
+    # a second sweep appended to the same file and directory
+    failures = run_sweep(
+        options,
+        grid({"fruit.probability": [0.3, 0.4]}),
+        str(results),
+        str(tmp_path),
+        workers=2,
+    )
+
+    assert failures == 0
+    with io.open(results) as file:
+        rows = list(csv.DictReader(file))
+    assert sorted(row["run"] for row in rows) == ["0", "1", "2", "3"]
+    assert all(row["error"] == "" for row in rows)
+    assert (tmp_path / "run_3").exists()
+
+
+def test_run_sweep_columns(tmp_path):
+    results = tmp_path / "results.csv"
+    results.write_text("run,wood.youngs_modulus,seed\n0,1.1,1\n")
+
+    with pytest.raises(ValueError, match="columns"):
+        run_sweep(
+            Options(),
+            grid({"fruit.probability": [0.1, 0.2]}),
+            str(results),
+            str(tmp_path),
+        )
+    assert results.read_text() == "run,wood.youngs_modulus,seed\n0,1.1,1\n"
@@ -1,28 +1,152 @@
-from typing import Optional, TYPE_CHECKING
+from typing import Any, Callable, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import concurrent.futures as cf
+import dataclasses as dc
+from datetime import datetime
+import inspect
+import time
 
 if TYPE_CHECKING:
+    import openalea.plantgl.all as pgl
     from pgljupyter import SceneWidget
 
 from .simulation import Simulation
 from .options import Options
+from .ensemble import run_ensemble, RunInfo, count_metamers
+from .sweep import run_sweep
+from .scenarios import run_scenarios
+from .render import RenderPolicy
 
 
-def run(simulation: Simulation, scene_widget: Optional["SceneWidget"] = None):
-    """ """
+def _show_scene(
+    simulation: Simulation, scene_widget: "SceneWidget", render_policy: RenderPolicy
+):
+    scene = render_policy.render(simulation)
+    if scene is not None:
+        scene_widget.set_scenes(scene, scales=0.1)
 
-    date_start = simulation.options.general.date_start
-    date_end = simulation.options.general.date_end
 
-    for _ in range((date_end - date_start).days):
+def run(
+    simulation: Simulation,
+    scene_widget: Optional["SceneWidget"] = None,
+    render_policy: Optional[RenderPolicy] = None,
+):
+    """Run a simulation until its end date
+
+    :param simulation: the simulation to run
+    :param scene_widget: a widget the scene is shown in
+    :param render_policy: when to show the scene (default is every day except during
+        a growth pause)
+    """
+
+    render_policy = render_policy or RenderPolicy()
+    while simulation.date < simulation.ending_date:
         simulation.advance()
 
         if scene_widget is not None:
-            events = simulation.get_active_events()
-            if "growth_pause" not in events and "leaf_out" not in events:
-                # avoid displaying scenes when nothing changes visualy during a growth pause
-                scene = simulation.get_scene()
-                if scene is not None:
-                    scene_widget.set_scenes(scene, scales=0.1)
+            _show_scene(simulation, scene_widget, render_policy)
+
+
+@dc.dataclass(frozen=True)
+class Progress:
+    """Progress of a simulation reported by :func:`run_async` after each time step"""
+
+    date: datetime
+    days: int  # days simulated so far
+    total_days: int  # days from the start to the end date
+    metamers: int
+    elapsed: float  # [s] wall time since the start of run_async
+
+
+def _step(
+    simulation: Simulation, count: bool, render_policy: Optional[RenderPolicy]
+) -> Tuple[Optional[int], Optional["pgl.Scene"]]:
+    """Advance the simulation and count its metamers and render its scene if
+    requested (in the executor of :func:`run_async`)"""
+    simulation.advance()
+    metamers = count_metamers(simulation) if count else None
+    scene = render_policy.render(simulation) if render_policy is not None else None
+    return metamers, scene
+
+
+async def run_async(
+    simulation: Simulation,
+    on_progress: Optional[Callable[[Progress], Any]] = None,
+    scene_widget: Optional["SceneWidget"] = None,
+    executor: Optional[cf.Executor] = None,
+    render_policy: Optional[RenderPolicy] = None,
+) -> Simulation:
+    """Run a simulation until its end date without blocking the event loop
+
+    Each time step, the metamer count and the scene are computed in `executor`
+    (default is the loop's default thread pool) and control is yielded to the event
+    loop in between, e.g. to keep a Jupyter kernel responsive. Only `on_progress` and
+    the `scene_widget` setters are called on the event loop. If the task is cancelled
+    the current time step is finished before the cancellation propagates, leaving
+    the simulation in a consistent state that may be continued later.
+
+    >>> task = asyncio.create_task(run_async(simulation, on_progress=print))
+    >>> task.cancel()
+
+    :param simulation: the simulation to run
+    :param on_progress: a function or coroutine function called with a
+        :class:`Progress` after each time step
+    :param scene_widget: a widget the scene is shown in after each time step
+    :param executor: a :class:`concurrent.futures.Executor` running the time steps
+    :param render_policy: when to show the scene, see :func:`run`
+    :returns: the simulation
+    """
+
+    if scene_widget is None:
+        # no scene is rendered without a widget to show it in
+        render_policy = None
+    else:
+        render_policy = render_policy or RenderPolicy()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    total_days = (simulation.ending_date - simulation.starting_date).days
+
+    while simulation.date < simulation.ending_date:
+        # yield to the event loop: a pending cancellation stops before the next step
+        await asyncio.sleep(0)
+        future = loop.run_in_executor(
+            executor, _step, simulation, on_progress is not None, render_policy
+        )
+        try:
+            metamers, scene = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the executor can not be interrupted: finish the time step first
+            await asyncio.wait([future])
+            raise
+
+        if on_progress is not None:
+            result = on_progress(
+                Progress(
+                    date=simulation.date,
+                    days=simulation.time_elapsed.days,
+                    total_days=total_days,
+                    metamers=metamers,
+                    elapsed=time.perf_counter() - start,
+                )
+            )
+            if inspect.isawaitable(result):
+                await result
+
+        if scene_widget is not None and scene is not None:
+            scene_widget.set_scenes(scene, scales=0.1)
+
+    return simulation
 
 
-__all__ = ["Simulation", "Options", "run"]
+__all__ = [
+    "Simulation",
+    "Options",
+    "run",
+    "run_async",
+    "Progress",
+    "RenderPolicy",
+    "run_ensemble",
+    "RunInfo",
+    "run_sweep",
+    "run_scenarios",
+]
@@ -0,0 +1,377 @@
+from typing import Any, Dict, List, Optional
+from datetime import date
+import argparse
+import cProfile
+import io
+import json
+import pathlib
+import pstats
+import sys
+import tempfile
+import time
+
+import toml
+
+from .simulation import Simulation
+from .options import Options, _toml_loads
+from .ensemble import run_ensemble
+from .markov import compile_models
+from .sweep import grid, latin_hypercube, run_sweep
+from .render import RenderPolicy
+from .tools.scene import SceneCache, _version
+from .tools.file_tools import get_shared_data_path
+
+COMMANDS = ("run", "batch", "bench", "profile", "compile")
+
+# standard timing scenarios of `bench` based on the shared simulation.toml
+BENCHMARKS = {
+    "flush": dict(date_start=date(1994, 5, 1), date_end=date(1994, 7, 1)),
+    "season": dict(date_start=date(1994, 5, 1), date_end=date(1994, 11, 1)),
+    "year": dict(date_start=date(1994, 5, 1), date_end=date(1995, 5, 1)),
+}
+
+
+def _parse_value(value: str) -> Any:
+    """Parse a toml value e.g. `1.2`, `true` or `1994-05-20`, fall back to a string"""
+    try:
+        return _toml_loads(f"value = {value}")["value"]
+    except toml.TomlDecodeError:
+        return value
+
+
+def _parse_overrides(overrides: List[str]) -> Dict[str, Any]:
+    parsed = {}
+    for override in overrides:
+        field, sep, value = override.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected field=value, got {override}")
+        parsed[field.strip()] = _parse_value(value.strip())
+    return parsed
+
+
+def _parse_seeds(seeds: List[str]) -> List[int]:
+    """Seeds as integers or ranges `start:stop`"""
+    parsed: List[int] = []
+    for seed in seeds:
+        if ":" in seed:
+            start, stop = seed.split(":")
+            parsed.extend(range(int(start), int(stop)))
+        else:
+            parsed.append(int(seed))
+    return parsed
+
+
+def _load_options(path: str, overrides: List[str]) -> Options:
+    with io.open(path) as file:
+        options = Options.loads(file.read())
+    for field, value in _parse_overrides(overrides).items():
+        options.set_field(field, value)
+    return options
+
+
+def _load_samples(path: str) -> List[Dict[str, Any]]:
+    with io.open(path) as file:
+        sweep = _toml_loads(file.read())
+    if "grid" in sweep:
+        return grid(sweep["grid"])
+    elif "latin_hypercube" in sweep:
+        config = sweep["latin_hypercube"]
+        return latin_hypercube(
+            config["bounds"], samples=config["samples"], seed=config.get("seed", 0)
+        )
+    raise ValueError(f"Expected a [grid] or [latin_hypercube] table in {path}")
+
+
+def _command_run(args: argparse.Namespace) -> int:
+    if args.restore:
+        # the only positional argument is the output directory
+        simulation = Simulation.restore(args.restore, args.output or args.config)
+        simulation.apply_options(_parse_overrides(args.set))
+    elif args.config:
+        simulation = Simulation(_load_options(args.config, args.set), args.output)
+    else:
+        raise SystemExit("Either a config file or --restore is required")
+
+    output_path = simulation.output_path
+    output_path.mkdir(parents=True, exist_ok=True)
+    render = bool(args.render_every or args.render_on_change)
+    # --render-on-change alone checks for changes every day
+    render_policy = RenderPolicy(
+        every=args.render_every or 1,
+        on_change=args.render_on_change,
+        growth_pause=True,
+    )
+    next_checkpoint = args.checkpoint_every
+    while simulation.date < simulation.ending_date:
+        simulation.advance()
+        days = simulation.time_elapsed.days
+        if render:
+            scene = render_policy.render(simulation)
+            if scene is not None:
+                scene.save(
+                    str(output_path / f"{simulation.date.date()}.{args.scene_format}")
+                )
+        if next_checkpoint and days >= next_checkpoint:
+            next_checkpoint = days + args.checkpoint_every
+            simulation.checkpoint(output_path / "checkpoint.pickle")
+
+    return 0
+
+
+def _command_batch(args: argparse.Namespace) -> int:
+    options = _load_options(args.config, args.set)
+    if args.sweep:
+        root = pathlib.Path(args.output or pathlib.Path.cwd() / "output")
+        root.mkdir(parents=True, exist_ok=True)
+        failures = run_sweep(
+            options,
+            _load_samples(args.sweep),
+            args.results or str(root / "sweep.csv"),
+            str(root),
+            args.workers,
+        )
+    else:
+        infos = run_ensemble(options, args.seeds, args.output, args.workers)
+        failures = sum(1 for info in infos if info.error is not None)
+
+    return 1 if failures else 0
+
+
+def _command_bench(args: argparse.Namespace) -> int:
+    with io.open(get_shared_data_path("simulation.toml")) as file:
+        config = file.read()
+
+    results = []
+    for name in args.only or BENCHMARKS.keys():
+        for repeat in range(args.repeat):
+            options = Options.loads(config)
+            for field, value in BENCHMARKS[name].items():
+                options.set_field(f"general.{field}", value)
+            for field, value in _parse_overrides(args.set).items():
+                options.set_field(field, value)
+            options.output.dates = []
+
+            with tempfile.TemporaryDirectory() as output_path:
+                start = time.perf_counter()
+                simulation = Simulation(options, output_path)
+                init = time.perf_counter() - start
+                while simulation.date < simulation.ending_date:
+                    simulation.advance()
+                run = time.perf_counter() - start - init
+                days = simulation.time_elapsed.days
+                scenes = _time_scenes(simulation) if args.scenes else {}
+
+            results.append(
+                dict(name=name, repeat=repeat, days=days, init=init, run=run, **scenes)
+            )
+            print(
+                f"{name:>8} #{repeat}: {days} days, init {init:.2f} s, "
+                f"run {run:.2f} s, {days / run:.2f} days/s"
+            )
+            if scenes:
+                print(
+                    f"{'':>8}     scene {scenes['scene']:.2f} s, versions "
+                    f"{scenes['versions']:.2f} s, cached scene "
+                    f"{scenes['scene_cold']:.2f} s, one day later "
+                    f"{scenes['scene_warm']:.2f} s"
+                )
+
+    if args.json:
+        with io.open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    return 0
+
+
+def _time_scenes(simulation: Simulation) -> Dict[str, float]:
+    """Seconds of a full scene interpretation, of the versions the scene cache
+    compares and of a scene cache before (cold) and after (warm) one more day"""
+    lsystems = simulation._lsystems
+    digits = simulation.options.general.scene_cache_digits or None
+    cache = SceneCache(lsystems.sceneInterpretation, digits)
+    metamers = [module[0] for module in lsystems.lstring if module.name == "metamer"]
+    times = {}
+    for name, scene in (
+        ("scene", lambda: lsystems.sceneInterpretation()),
+        ("versions", lambda: [_version(metamer, digits) for metamer in metamers]),
+        ("scene_cold", lambda: cache.scene(lsystems.lstring)),
+        ("scene_warm", lambda: cache.scene(lsystems.lstring)),
+    ):
+        if name == "scene_warm":
+            simulation.advance()
+        start = time.perf_counter()
+        scene()
+        times[name] = time.perf_counter() - start
+    return times
+
+
+def _command_profile(args: argparse.Namespace) -> int:
+    options = _load_options(args.config, args.set)
+    stats_path = pathlib.Path(args.stats or pathlib.Path.cwd() / "profile")
+    stats_path.mkdir(parents=True, exist_ok=True)
+
+    if not options.output.trace:
+        # the tracer times the derivation of each lsystem
+        options.output.trace = str(stats_path.resolve() / "trace.jsonl")
+
+    profiles = dict(init=cProfile.Profile(), run=cProfile.Profile())
+    with profiles["init"]:
+        simulation = Simulation(options, args.output)
+    with profiles["run"]:
+        while simulation.date < simulation.ending_date:
+            simulation.advance()
+
+    for phase, profile in profiles.items():
+        profile.dump_stats(stats_path / f"{phase}.pstats")
+        print(f"# {phase}")
+        pstats.Stats(profile).sort_stats(args.sort).print_stats(args.top)
+
+    assert simulation.tracer is not None
+    phases = _phases(simulation.tracer.totals)
+    with io.open(stats_path / "phases.json", "w") as file:
+        json.dump(phases, file, indent=2)
+    print("# phases")
+    total = sum(seconds for name, seconds in phases.items() if "/" not in name)
+    for name, seconds in phases.items():
+        indent = "  " * name.count("/")
+        share = 100 * seconds / total if total else 0.0
+        print(f"{indent + name:<32} {seconds:10.3f} s {share:6.1f} %")
+
+    return 0
+
+
+def _phases(totals: Dict[str, float]) -> Dict[str, float]:
+    """Seconds per lsystem and per group of lsystems (e.g. 'mechanics') in
+    derivation order"""
+    phases: Dict[str, float] = {}
+    for lsystem, seconds in totals.items():
+        path = lsystem.split("/")
+        for i in range(1, len(path) + 1):
+            name = "/".join(path[:i])
+            phases[name] = phases.get(name, 0.0) + seconds
+    return phases
+
+
+def _command_compile(args: argparse.Namespace) -> int:
+    for path in compile_models(args.path or get_shared_data_path("markov")):
+        print(path)
+
+    return 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m vmapplet", description="VMAppleT simulations"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_command(name: str, help: str, config: bool = True):
+        command = commands.add_parser(name, help=help)
+        if config:
+            command.add_argument("config", help="simulation toml file")
+            command.add_argument("output", nargs="?", help="output directory")
+        command.add_argument(
+            "--set",
+            action="append",
+            default=[],
+            metavar="FIELD=VALUE",
+            help="override an option e.g. general.date_end=1995-06-30",
+        )
+        return command
+
+    run = add_command("run", "run a single simulation", config=False)
+    run.add_argument("config", nargs="?", help="simulation toml file")
+    run.add_argument("output", nargs="?", help="output directory")
+    run.add_argument(
+        "--restore", help="continue from a checkpoint file instead of a config file"
+    )
+    run.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=0,
+        metavar="DAYS",
+        help="write output/checkpoint.pickle every DAYS days",
+    )
+    run.add_argument(
+        "--render-every",
+        type=int,
+        default=0,
+        metavar="DAYS",
+        help="save the scene every DAYS days",
+    )
+    run.add_argument(
+        "--render-on-change",
+        action="store_true",
+        help="save the scene only if the number of modules or an organ state changed "
+        "(checked every day unless --render-every is set)",
+    )
+    run.add_argument(
+        "--scene-format",
+        choices=("bgeom", "geom"),
+        default="bgeom",
+        help="file format of saved scenes",
+    )
+    run.set_defaults(func=_command_run)
+
+    batch = add_command("batch", "run an ensemble of seeds or a parameter sweep")
+    source = batch.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--seeds",
+        nargs="+",
+        help="seeds as integers or ranges start:stop",
+    )
+    source.add_argument(
+        "--sweep", help="toml file with a [grid] or [latin_hypercube] table"
+    )
+    batch.add_argument("--results", help="sweep results csv (default output/sweep.csv)")
+    batch.add_argument("--workers", type=int, help="number of worker processes")
+    batch.set_defaults(func=_command_batch)
+
+    bench = add_command("bench", "time standard simulation scenarios", config=False)
+    bench.add_argument("--only", nargs="+", choices=tuple(BENCHMARKS.keys()))
+    bench.add_argument("--repeat", type=int, default=1)
+    bench.add_argument("--json", help="write the timings to a json file")
+    bench.add_argument(
+        "--scenes",
+        action="store_true",
+        help="time the scene at the end with and without the scene cache",
+    )
+    bench.set_defaults(func=_command_bench)
+
+    profile = add_command(
+        "profile", "profile the init and run phases and time each lsystem"
+    )
+    profile.add_argument(
+        "--stats", help="directory of the pstats, trace and phases.json files"
+    )
+    profile.add_argument("--sort", default="cumulative", help="pstats sort key")
+    profile.add_argument("--top", type=int, default=30, help="number of rows printed")
+    profile.set_defaults(func=_command_profile)
+
+    compile = commands.add_parser(
+        "compile", help="precompile the Markov models (.toml) of a directory to .npz"
+    )
+    compile.add_argument(
+        "path", nargs="?", help="directory of the models (default shared models)"
+    )
+    compile.set_defaults(func=_command_compile)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point, see `python -m vmapplet --help`
+
+    The legacy form `python -m vmapplet config output` is the same as
+    `python -m vmapplet run config output`.
+    """
+
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith("-"):
+        argv.insert(0, "run")
+
+    args = _parser().parse_args(argv)
+    if getattr(args, "seeds", None) is not None:
+        args.seeds = _parse_seeds(args.seeds)
+
+    return args.func(args)
@@ -5,9 +5,13 @@ defines trigonometric constants such as
 
     \pi, \\frac{\pi}{2}, \\frac{\pi}{4}, 2\pi
 
+and the scale of the scene.
 """
 from scipy import pi
 
 quarter_pi = pi * 0.25
 half_pi = pi * 0.5
 two_pi = 2.0 * pi
+
+# turtle units per meter of the shoot lengths and widths in interpretation.lpy
+scene_scale = 10.0
@@ -0,0 +1,147 @@
+from typing import Callable, Dict, Iterable, List, Optional, Union, TYPE_CHECKING
+import concurrent.futures as cf
+import dataclasses as dc
+import copy
+import io
+import os
+import pathlib
+import time
+import traceback
+
+import toml
+
+from .options import Options
+
+if TYPE_CHECKING:
+    from .simulation import Simulation
+
+
+@dc.dataclass
+class RunInfo:
+    """Metadata of a single simulation run collected by the parent process"""
+
+    seed: int
+    output_path: str
+    name: Optional[str] = None
+    elapsed: float = 0.0  # [s]
+    days: int = 0
+    summary: Dict[str, float] = dc.field(default_factory=lambda: dict())
+    error: Optional[str] = None
+
+
+SUMMARY_FIELDS = (
+    "metamers",
+    "growth_units",
+    "first_branches",
+    "fruits",
+    "trunk_radius",
+    "trunk_cross_sectional_area",
+)
+
+
+def count_metamers(simulation: "Simulation") -> int:
+    """Number of metamers in the current lstring of a simulation"""
+    return sum(1 for module in simulation.lstring if module.name == "metamer")
+
+
+def summarize(simulation: "Simulation") -> Dict[str, float]:
+    """Summary of the tree state at the current date of a simulation"""
+
+    tree = simulation.tree
+    summary = dict(metamers=count_metamers(simulation))
+    for field in SUMMARY_FIELDS[1:]:
+        summary[field] = getattr(tree, field)
+    return summary
+
+
+def _run(options: Options, output_path: str) -> RunInfo:
+    # imported here to avoid a circular import with the package __init__
+    from . import Simulation
+
+    return _complete(
+        lambda: Simulation(options, output_path),
+        RunInfo(seed=options.general.seed, output_path=output_path),
+    )
+
+
+def _complete(create: Callable[[], "Simulation"], info: RunInfo) -> RunInfo:
+    """Run a simulation created by `create` until its end date and fill `info`"""
+    from . import run
+
+    start = time.perf_counter()
+    try:
+        simulation = create()
+        run(simulation)
+        info.days = simulation.time_elapsed.days
+        info.summary = summarize(simulation)
+    except Exception:
+        info.error = traceback.format_exc()
+    info.elapsed = time.perf_counter() - start
+
+    return info
+
+
+def _with_seed(options: Options, seed: int) -> Options:
+    options = copy.deepcopy(options)
+    options.general.seed = seed
+    return options
+
+
+def run_ensemble(
+    options: Union[str, Options],
+    seeds: Iterable[int],
+    output_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> List[RunInfo]:
+    """Run one simulation per seed in a pool of worker processes
+
+    Each run writes its output into a separate directory `seed_<seed>` below
+    `output_path`. A summary of all runs is written to `runs.toml`.
+
+    :param options: a string (toml) or an Options instance
+    :param seeds: a list or range of values used as `general.seed`
+    :param output_path: a string/path were the run directories will be created
+    :param workers: the number of worker processes (default is the number of CPUs)
+    :returns: a list of RunInfo in the order of `seeds`
+    """
+
+    if not isinstance(options, Options):
+        options = Options.loads(options)
+
+    seeds = list(seeds)
+    if len(set(seeds)) != len(seeds):
+        raise ValueError("Seeds in an ensemble must be unique")
+
+    root = pathlib.Path(output_path or os.getcwd() + "/output")
+    root.mkdir(parents=True, exist_ok=True)
+
+    infos: List[RunInfo] = []
+    with cf.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run, _with_seed(options, seed), str(root / f"seed_{seed}"))
+            for seed in seeds
+        ]
+        for future in cf.as_completed(futures):
+            info = future.result()
+            if info.error is not None:
+                print(f"Warning: run with seed {info.seed} failed")
+            infos.append(info)
+
+    infos.sort(key=lambda info: seeds.index(info.seed))
+    _write_runs(root / "runs.toml", infos)
+
+    return infos
+
+
+def _write_runs(path: pathlib.Path, infos: List[RunInfo]):
+    with io.open(path, "w") as file:
+        file.write(
+            toml.dumps(
+                dict(
+                    runs=[
+                        {k: v for k, v in dc.asdict(info).items() if v is not None}
+                        for info in infos
+                    ]
+                )
+            )
+        )
@@ -1,13 +1,25 @@
-from typing import List, Tuple, Union, TypedDict, Optional
+from typing import Any, Deque, Dict, List, Tuple, Union, TypedDict, Optional
+from collections import deque
 import dataclasses as dc
+import hashlib
+import io
+import json
+import pathlib
+import time
+import warnings
 
 import numpy as np
+import toml
 
 MarkovSequence = List[Tuple[Union[int, None], int]]
 InitialProbabilities = Tuple[float]
 TransitionProbabilities = Tuple[Tuple[float]]
 ObservationDistributions = Tuple[Tuple[float]]
 OccupancyDistributions = Tuple["OccupancyDistribution"]
+# model length, model year, lower and upper bound
+PoolKey = Tuple[str, int, int, int]
+# model year, model length, lower and upper bound
+StatsKey = Tuple[int, str, int, int]
 
 
 class OccupancyDistribution(TypedDict):
@@ -17,6 +29,112 @@ class OccupancyDistribution(TypedDict):
     bounds: Tuple[float, float]
 
 
+def _cdf(probabilities: np.ndarray) -> np.ndarray:
+    """Cumulative distribution(s) along the last axis
+
+    Divided by the total so that values of (trailing) zero probabilities are exactly 1
+    and never drawn by :func:`_draw`.
+    """
+    cdf = np.cumsum(probabilities, axis=-1)
+    return cdf / cdf[..., -1:]
+
+
+def _draw(cdf: np.ndarray, uniform: Union[float, np.ndarray]) -> np.ndarray:
+    """Indices drawn from a distribution by inverse transform of uniform(s) in [0, 1)"""
+    return cdf.searchsorted(uniform, side="right")
+
+
+# occupancies above are drawn as one value (MAXIMUM_OCCUPANCY + 1): a sequence is at
+# most 300 long (see Markov) and all longer sequences are rejected
+MAXIMUM_OCCUPANCY = 300
+
+
+# acceptance probabilities and aliases of a (row-wise) distribution
+AliasTable = Tuple[np.ndarray, np.ndarray]
+
+
+def _alias_table(probabilities: np.ndarray) -> AliasTable:
+    """Walker alias table of a distribution (Vose's method)
+
+    Outcomes of zero probability have an acceptance of 0 and are never drawn.
+    """
+    n = len(probabilities)
+    scaled = np.asarray(probabilities, dtype=float) * n / np.sum(probabilities)
+    accept = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        accept[less] = scaled[less]
+        alias[less] = more
+        scaled[more] += scaled[less] - 1.0
+        (small if scaled[more] < 1.0 else large).append(more)
+    # the rest has an acceptance of 1 (up to rounding)
+    return accept, alias
+
+
+def _alias_tables(probabilities: np.ndarray) -> AliasTable:
+    """Alias tables of each row of a matrix"""
+    tables = [_alias_table(row) for row in probabilities]
+    return (
+        np.array([accept for accept, _ in tables]),
+        np.array([alias for _, alias in tables]),
+    )
+
+
+def _draw_alias(
+    accept: np.ndarray, alias: np.ndarray, uniforms: np.ndarray
+) -> np.ndarray:
+    """Indices drawn from an alias table with pairs of uniforms of shape (2, ...)"""
+    index = (uniforms[0] * len(accept)).astype(int)
+    return np.where(uniforms[1] < accept[index], index, alias[index])
+
+
+def _draw_alias_once(
+    accept: List[float], alias: List[int], rng: np.random.Generator
+) -> int:
+    """A single draw of :func:`_draw_alias` from an alias table as lists"""
+    u, v = rng.random(2).tolist()
+    index = int(u * len(accept))
+    return index if v < accept[index] else alias[index]
+
+
+def _occupancy_pmf(distribution: OccupancyDistribution, size: int) -> np.ndarray:
+    """Probabilities of the occupancies 0 to size - 1 of a distribution truncated to
+    its bounds (all zero if it has no probability within its bounds)"""
+    lbound, ubound = distribution["bounds"]
+    name = distribution["distribution"]
+    # up to the upper bound (if finite) to calculate the probability within bounds
+    n = int(max(size, 2, lbound + 1, ubound + 1 if np.isfinite(ubound) else 0))
+    k = np.arange(n)
+    if name == "NEGATIVE_BINOMIAL":
+        parameter = distribution["parameter"]
+        probability = distribution["probability"]
+        ratios = (k[1:] - 1 + parameter) / k[1:] * (1 - probability)
+        pmf = probability**parameter * np.cumprod(np.concatenate(([1.0], ratios)))
+    elif name == "BINOMIAL":
+        # a single trial as drawn in Markov._markov
+        probability = distribution["probability"]
+        pmf = np.zeros(n)
+        pmf[:2] = (1 - probability, probability)
+    elif name == "POISSON":
+        parameter = distribution["parameter"]
+        ratios = parameter / k[1:]
+        pmf = np.exp(-parameter) * np.cumprod(np.concatenate(([1.0], ratios)))
+    else:
+        raise ValueError(f"Distribution {name} not supported")
+
+    inside = (k >= lbound) & (k <= ubound)
+    if np.isfinite(ubound):
+        total = pmf[inside].sum()
+    else:
+        total = 1 - pmf[k < lbound].sum()
+    if total <= 0:
+        return np.zeros(size)
+    return np.where(inside, pmf, 0.0)[:size] / total
+
+
 @dc.dataclass
 class MarkovModel:
     year: int
@@ -27,6 +145,16 @@ class MarkovModel:
     observation_distributions: ObservationDistributions
 
     _final_state = 0
+    # alias tables of the probabilities (of each row), lists for single draws
+    _initial_alias = None
+    _transition_aliases = None
+    _observation_aliases = None
+    # cumulative occupancy distributions truncated to their bounds and whether a state
+    # has any occupancy within its bounds
+    _occupancy_cdfs = None
+    _occupancy_possible = None
+    # probabilities by length, see length_probabilities
+    _length_probabilities = None
 
     def __post_init__(self):
         self.length = self.length.upper()
@@ -53,10 +181,256 @@ class MarkovModel:
 
         self._final_state = no_states - 1
 
+        self._initial_alias = tuple(
+            table.tolist() for table in _alias_table(self.initial_probabilities)
+        )
+        self._transition_aliases = tuple(
+            table.tolist() for table in _alias_tables(self.transition_probabilities)
+        )
+        self._observation_aliases = _alias_tables(self.observation_distributions)
+
+        occupancies = np.array(
+            [
+                _occupancy_pmf(distribution, MAXIMUM_OCCUPANCY + 1)
+                for distribution in self.occupancy_distributions
+            ]
+        )
+        self._occupancy_possible = occupancies.sum(axis=1) > 0
+        # the probability of occupancies above the maximum
+        above = np.clip(1 - occupancies.sum(axis=1, keepdims=True), 0.0, None)
+        occupancies = np.hstack((occupancies, above))
+        occupancies[~self._occupancy_possible, 0] = 1.0
+        self._occupancy_cdfs = _cdf(occupancies)
+
     @property
     def final_state(self):
         return self._final_state
 
+    def save(self, path: Union[str, pathlib.Path], source: str = ""):
+        """Write the normalized model and its tables to a `.npz` file
+
+        A model read from it by :func:`load_model` needs no normalization or tables.
+
+        :param source: the sha256 of the `.toml` file the model was read from
+        """
+        np.savez(
+            path,
+            source=source,
+            year=self.year,
+            length=self.length,
+            initial_probabilities=self.initial_probabilities,
+            transition_probabilities=self.transition_probabilities,
+            observation_distributions=self.observation_distributions,
+            occupancy_distributions=json.dumps(list(self.occupancy_distributions)),
+            initial_accept=self._initial_alias[0],
+            initial_alias=self._initial_alias[1],
+            transition_accept=self._transition_aliases[0],
+            transition_alias=self._transition_aliases[1],
+            observation_accept=self._observation_aliases[0],
+            observation_alias=self._observation_aliases[1],
+            occupancy_cdfs=self._occupancy_cdfs,
+            occupancy_possible=self._occupancy_possible,
+        )
+
+    @classmethod
+    def _from_npz(cls, file: Any) -> "MarkovModel":
+        with np.load(file) as arrays:
+            arrays = {name: arrays[name] for name in arrays.files}
+        # no __post_init__: all fields and tables are normalized/calculated already
+        model = cls.__new__(cls)
+        model.year = int(arrays["year"])
+        model.length = str(arrays["length"])
+        model.initial_probabilities = arrays["initial_probabilities"]
+        model.transition_probabilities = arrays["transition_probabilities"]
+        model.observation_distributions = arrays["observation_distributions"]
+        model.occupancy_distributions = json.loads(
+            str(arrays["occupancy_distributions"])
+        )
+        model._final_state = len(model.initial_probabilities) - 1
+        model._initial_alias = (
+            arrays["initial_accept"].tolist(),
+            arrays["initial_alias"].tolist(),
+        )
+        model._transition_aliases = (
+            arrays["transition_accept"].tolist(),
+            arrays["transition_alias"].tolist(),
+        )
+        model._observation_aliases = (
+            arrays["observation_accept"],
+            arrays["observation_alias"],
+        )
+        model._occupancy_cdfs = arrays["occupancy_cdfs"]
+        model._occupancy_possible = arrays["occupancy_possible"]
+        return model
+
+    def draw_initial(self, rng: np.random.Generator) -> int:
+        accept, alias = self._initial_alias
+        return _draw_alias_once(accept, alias, rng)
+
+    def draw_transition(self, state: int, rng: np.random.Generator) -> int:
+        accept, alias = self._transition_aliases
+        return _draw_alias_once(accept[state], alias[state], rng)
+
+    def draw_occupancies(
+        self, states: List[int], rng: np.random.Generator
+    ) -> Optional[List[int]]:
+        """Occupancies of states within the bounds of their distributions
+
+        Occupancies above :data:`MAXIMUM_OCCUPANCY` are MAXIMUM_OCCUPANCY + 1. None if
+        a state has no occupancy within its bounds.
+        """
+        if not self._occupancy_possible[states].all():
+            return None
+        uniforms = rng.random(len(states))
+        return (self._occupancy_cdfs[states] <= uniforms[:, None]).sum(axis=1).tolist()
+
+    def draw_observations(
+        self, state: int, size: int, rng: np.random.Generator
+    ) -> List[int]:
+        accept, alias = self._observation_aliases
+        return _draw_alias(accept[state], alias[state], rng.random((2, size))).tolist()
+
+    def length_probabilities(
+        self, size: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Probabilities of the lengths 0 to size - 1 of (parts of) sequences
+
+        Calculated by dynamic programming over states and occupancies and cached for
+        the largest size requested so far. All arrays have a row per state (excluding
+        the final state):
+
+            * occupancies: probability of an occupancy of the state
+            * lengths: probability of a sequence of that length starting in the state
+            * continuations: probability of a sequence of that length following the
+              state (excluding the state)
+        """
+        if (
+            self._length_probabilities is not None
+            and self._length_probabilities[0].shape[1] >= size
+        ):
+            return self._length_probabilities
+
+        final_state = self._final_state
+        occupancies = np.array(
+            [_occupancy_pmf(d, size) for d in self.occupancy_distributions]
+        )
+        transitions = self.transition_probabilities[:final_state, :final_state]
+        exits = self.transition_probabilities[:final_state, final_state]
+        lengths = np.zeros((final_state, size))
+        continuations = np.zeros((final_state, size))
+        # with an occupancy of 0 the length of a state depends on itself
+        system = np.eye(final_state) - occupancies[:, :1] * transitions
+        for n in range(size):
+            exit = exits if n == 0 else 0.0
+            # occupancies 1 to n followed by continuations of length n - 1 to 0
+            following = continuations[:, :n][:, ::-1]
+            end = n + 1
+            length = (occupancies[:, 1:end] * following).sum(axis=1)
+            lengths[:, n] = np.linalg.solve(system, length + occupancies[:, 0] * exit)
+            continuations[:, n] = transitions @ lengths[:, n] + exit
+
+        self._length_probabilities = (occupancies, lengths, continuations)
+        return self._length_probabilities
+
+
+@dc.dataclass
+class SequenceStats:
+    """Counters of the bounded sequence generation of a model and bounds"""
+
+    calls: int = 0
+    # drawn sequences including rejected ones
+    iterations: int = 0
+    # calls that reached the maximum iterations
+    failures: int = 0
+    max_seconds: float = 0.0
+    # number of calls by iterations rounded up to a power of 2
+    histogram: Dict[int, int] = dc.field(default_factory=lambda: dict())
+
+    def record(self, iterations: int, seconds: float, failed: bool = False):
+        self.calls += 1
+        self.iterations += iterations
+        self.failures += int(failed)
+        self.max_seconds = max(self.max_seconds, seconds)
+        bucket = 1 << (iterations - 1).bit_length()
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+# models by file content hash, shared by all simulations of a process
+_models: Dict[str, MarkovModel] = {}
+
+
+def load_model(path: Union[str, pathlib.Path]) -> MarkovModel:
+    """Read a model from a `.toml` or a `.npz` file (see :meth:`MarkovModel.save`)
+
+    Models are cached by file content: all simulations of a process share one
+    instance per model. Its arrays are read-only.
+    """
+    path = pathlib.Path(path)
+    with io.open(path, "rb") as file:
+        content = file.read()
+    key = _sha256(content)
+    model = _models.get(key)
+    if model is None:
+        if path.suffix == ".npz":
+            model = MarkovModel._from_npz(io.BytesIO(content))
+        else:
+            model = MarkovModel(**toml.loads(content.decode()))
+        for value in vars(model).values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        for table in model._observation_aliases:
+            table.flags.writeable = False
+        _models[key] = model
+    return model
+
+
+def compile_models(path: Union[str, pathlib.Path]) -> List[pathlib.Path]:
+    """Write a `.npz` file next to each `.toml` model in directory `path`"""
+    compiled = []
+    for toml_path in sorted(pathlib.Path(path).glob("*.toml")):
+        npz_path = toml_path.with_suffix(".npz")
+        load_model(toml_path).save(npz_path, _sha256(toml_path.read_bytes()))
+        compiled.append(npz_path)
+    return compiled
+
+
+def _is_stale(npz_path: pathlib.Path, toml_path: pathlib.Path) -> bool:
+    """True if `npz_path` was not compiled from the current `toml_path`"""
+    with np.load(npz_path) as arrays:
+        source = str(arrays["source"]) if "source" in arrays.files else ""
+    return source != _sha256(toml_path.read_bytes())
+
+
+def load_models(path: Union[str, pathlib.Path]) -> Dict[Tuple[str, int], MarkovModel]:
+    """All models in directory `path` by length and year
+
+    A `.npz` file is preferred to a `.toml` file of the same model unless it was
+    compiled from another version of the `.toml` file (see :func:`compile_models`).
+    """
+    models = {}
+    paths = [p for p in pathlib.Path(path).iterdir() if p.suffix in (".toml", ".npz")]
+    for model_path in sorted(paths, key=lambda p: (p.suffix == ".npz", p.name)):
+        if not model_path.is_file():
+            continue
+        toml_path = model_path.with_suffix(".toml")
+        if (
+            model_path.suffix == ".npz"
+            and toml_path.is_file()
+            and _is_stale(model_path, toml_path)
+        ):
+            warnings.warn(
+                f"{model_path} is out of date, using {toml_path.name} instead "
+                "(recompile with compile_models)"
+            )
+            continue
+        model = load_model(model_path)
+        models[(model.length, model.year)] = model
+    return models
+
 
 class Markov:
     """
@@ -69,6 +443,9 @@ class Markov:
     _long: Union[MarkovModel, None] = None
     _minimum_length: int
     _maximum_length: int
+    _exact: bool
+    _pool: Optional["SequencePool"] = None
+    _stats: Dict[StatsKey, SequenceStats]
 
     def __init__(
         self,
@@ -76,7 +453,12 @@ class Markov:
         minimum_length: int = 4,
         maximum_length: int = 70,
         max_iterations: int = 1000,
+        exact: bool = False,
     ):
+        """
+        :param exact: draw sequences conditioned on their length instead of drawing
+            until a sequence is within bounds (see :meth:`_markov_exact`)
+        """
         assert maximum_length <= 300
         assert maximum_length > minimum_length
         assert minimum_length > 0
@@ -85,6 +467,8 @@ class Markov:
         self._minimum_length = minimum_length
         self._maximum_length = maximum_length
         self._max_iterations = max_iterations
+        self._exact = exact
+        self._stats = {}
 
     @property
     def minimum_length(self) -> int:
@@ -94,57 +478,44 @@ class Markov:
     def maximum_length(self) -> int:
         return self._maximum_length
 
+    @property
+    def pool(self) -> Optional["SequencePool"]:
+        return self._pool
+
+    @property
+    def stats(self) -> Dict[StatsKey, SequenceStats]:
+        """Counters of the bounded sequence generation by model year, model length
+        and bounds"""
+        return self._stats
+
     def set_models(self, medium: MarkovModel, long: MarkovModel) -> "Markov":
         self._medium = medium
         self._long = long
         return self
 
+    def set_pool(self, pool: Optional["SequencePool"]) -> "Markov":
+        """Take bounded sequences from `pool` instead of generating them on request"""
+        self._pool = pool
+        return self
+
     def _markov(
         self, model: MarkovModel, lower_bound: int, upper_bound: int
     ) -> Union[MarkovSequence, None]:
         final_state = model.final_state
-        state: int = np.flatnonzero(
-            self._rng.multinomial(1, model.initial_probabilities)
-        ).item()
+        rng = self._rng
+        state = model.draw_initial(rng)
 
         states = [state]
         while True:
-            state = np.flatnonzero(
-                self._rng.multinomial(1, model.transition_probabilities[state])
-            ).item()
+            state = model.draw_transition(state, rng)
             if state == final_state:
                 break
             states.append(state)
 
-        occupancies = []
-        for state in states:
-            occupancy = 0
-            distribution = model.occupancy_distributions[state]
-            lbound, ubound = distribution["bounds"]
-            fn = None
-            parameters = tuple()
-            if distribution["distribution"] == "NEGATIVE_BINOMIAL":
-                fn = self._rng.negative_binomial
-                parameter = distribution["parameter"]
-                probability = distribution["probability"]
-                parameters = (parameter, probability)
-            elif distribution["distribution"] == "BINOMIAL":
-                fn = self._rng.binomial
-                probability = distribution["probability"]
-                parameters = (1, probability)
-            elif distribution["distribution"] == "POISSON":
-                fn = self._rng.poisson
-                parameter = distribution["parameter"]
-                parameters = (parameter,)
-            if fn is None:
-                raise ValueError(
-                    f"Distribution {distribution['distribution']} not supported"
-                )
-            while True:
-                occupancy = fn(*parameters)
-                if occupancy >= lbound and occupancy <= ubound:
-                    break
-            occupancies.append(occupancy)
+        occupancies = model.draw_occupancies(states, rng)
+        if occupancies is None:
+            # not a sequence of the model
+            return None
 
         # early return if we know we do not satisfy bounds
         length = sum(occupancies)
@@ -153,18 +524,75 @@ class Markov:
 
         sequence: MarkovSequence = []
         for state, occupancy in zip(states, occupancies):
-            distribution = model.observation_distributions[state]
-            for i in range(occupancy):
-                observation: int = np.flatnonzero(
-                    self._rng.multinomial(1, distribution)
-                ).item()
-                sequence.append((state, observation))
+            # all observations of a state at once
+            observations = model.draw_observations(state, occupancy, rng)
+            sequence.extend((state, observation) for observation in observations)
+
+        return sequence
+
+    def _markov_exact(
+        self, model: MarkovModel, lower_bound: int, upper_bound: int
+    ) -> MarkovSequence:
+        """A sequence drawn from the distribution of sequences within bounds
+
+        The distribution is the same as the one of sequences drawn by :meth:`_markov`
+        until one is within bounds. First the initial state and the length are drawn,
+        then the occupancy and the next state given the remaining length.
+        """
+        occupancies, lengths, continuations = model.length_probabilities(
+            upper_bound + 1
+        )
+        final_state = model.final_state
+        rng = self._rng
+
+        end = upper_bound + 1
+        weights = (
+            model.initial_probabilities[:final_state, None]
+            * lengths[:, lower_bound:end]
+        )
+        if not weights.sum() > 0:
+            raise ValueError(
+                f"No sequence of length {lower_bound} to {upper_bound} in model"
+            )
+        state, remaining = divmod(
+            int(_draw(_cdf(weights.ravel()), rng.random())), weights.shape[1]
+        )
+        remaining += lower_bound
+
+        sequence: MarkovSequence = []
+        while state != final_state:
+            # an occupancy of 0 to remaining followed by the rest of the sequence
+            end = remaining + 1
+            following = continuations[state, :end][::-1]
+            weights = occupancies[state, :end] * following
+            occupancy = int(_draw(_cdf(weights), rng.random()))
+            remaining -= occupancy
+            observations = model.draw_observations(state, occupancy, rng)
+            sequence.extend((state, observation) for observation in observations)
+
+            transitions = model.transition_probabilities[state]
+            weights = np.append(
+                transitions[:final_state] * lengths[:, remaining],
+                transitions[final_state] if remaining == 0 else 0.0,
+            )
+            state = int(_draw(_cdf(weights), rng.random()))
 
         return sequence
 
     def _generate_sequence(
         self, model: MarkovModel, lower_bound: int, upper_bound: int
     ) -> MarkovSequence:
+        key = (model.year, model.length, lower_bound, upper_bound)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = SequenceStats()
+        start = time.perf_counter()
+
+        if self._exact:
+            sequence = self._markov_exact(model, lower_bound, upper_bound)
+            stats.record(1, time.perf_counter() - start)
+            return sequence
+
         iterations = 0
         sequence = None
 
@@ -172,6 +600,7 @@ class Markov:
             sequence = self._markov(model, lower_bound, upper_bound)
             iterations += 1
 
+        stats.record(iterations, time.perf_counter() - start, sequence is None)
         if sequence is None:
             raise ValueError(
                 f"Maximum iteration of {iterations} reached in sequence generation"
@@ -191,6 +620,8 @@ class Markov:
         if self._medium is None:
             raise ValueError("No medium MarkovModel set.")
 
+        if self._pool is not None:
+            return self._pool.get(self._medium, lower_bound, upper_bound)
         return self._generate_sequence(self._medium, lower_bound, upper_bound)
 
     def generate_bounded_long_sequence(
@@ -201,4 +632,146 @@ class Markov:
         if self._long is None:
             raise ValueError("No long MarkovModel set.")
 
+        if self._pool is not None:
+            return self._pool.get(self._long, lower_bound, upper_bound)
         return self._generate_sequence(self._long, lower_bound, upper_bound)
+
+
+@dc.dataclass
+class _PoolBuffer:
+    markov: Markov
+    model: MarkovModel
+    lower_bound: int
+    upper_bound: int
+    sequences: Deque[MarkovSequence] = dc.field(default_factory=lambda: deque())
+
+
+class SequencePool:
+    """Buffers of pre-generated bounded sequences per model and bounds
+
+    Sequences are generated in bulk by :meth:`refill` (e.g. once per time step) so
+    that a bud break, when many apices request sequences, takes them from the buffers.
+    An empty buffer is refilled on request.
+
+    Each buffer draws from its own random stream, spawned from `seed` with the model
+    and bounds as key. Hence the n-th sequence of a buffer does not depend on when it
+    was generated or on the requests of other buffers.
+
+    :param markov: the Markov instance the pool serves, its length settings are used
+    :param seed: the seed of all streams
+    :param size: the number of sequences per buffer
+    """
+
+    _markov: Markov
+    _seed: int
+    _size: int
+    _buffers: Dict[PoolKey, _PoolBuffer]
+    # states by key of buffers not requested since set_state
+    _states: Dict[PoolKey, Tuple[List[MarkovSequence], Dict[str, Any]]]
+
+    def __init__(self, markov: Markov, seed: int, size: int = 256):
+        assert size > 0
+        self._markov = markov
+        self._seed = seed
+        self._size = size
+        self._buffers = {}
+        self._states = {}
+
+    def _generator(self, key: PoolKey) -> np.random.Generator:
+        length, year, lower_bound, upper_bound = key
+        seed_sequence = np.random.SeedSequence(
+            self._seed,
+            spawn_key=(year, lower_bound, upper_bound, *length.encode()),
+        )
+        return np.random.default_rng(seed_sequence)
+
+    def _worker(self, generator: np.random.Generator) -> Markov:
+        markov = self._markov
+        worker = Markov(
+            generator,
+            markov._minimum_length,
+            markov._maximum_length,
+            markov._max_iterations,
+            markov._exact,
+        )
+        # counted as sequences of markov
+        worker._stats = markov._stats
+        return worker
+
+    def _buffer(
+        self, model: MarkovModel, lower_bound: int, upper_bound: int
+    ) -> _PoolBuffer:
+        key = (model.length, model.year, lower_bound, upper_bound)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            generator = self._generator(key)
+            sequences, state = self._states.pop(key, ([], None))
+            if state is not None:
+                generator.bit_generator.state = state
+            buffer = _PoolBuffer(
+                self._worker(generator),
+                model,
+                lower_bound,
+                upper_bound,
+                deque(sequences),
+            )
+            self._buffers[key] = buffer
+        return buffer
+
+    def _fill(self, buffer: _PoolBuffer):
+        for _ in range(self._size - len(buffer.sequences)):
+            buffer.sequences.append(
+                buffer.markov._generate_sequence(
+                    buffer.model, buffer.lower_bound, buffer.upper_bound
+                )
+            )
+
+    def get(
+        self, model: MarkovModel, lower_bound: int, upper_bound: int
+    ) -> MarkovSequence:
+        """The next sequence of `model` within bounds"""
+        buffer = self._buffer(model, lower_bound, upper_bound)
+        if not buffer.sequences:
+            self._fill(buffer)
+        return buffer.sequences.popleft()
+
+    def refill(self):
+        """Fill all buffers of the current models of markov, drop all others"""
+        models = (self._markov._medium, self._markov._long)
+        for key, buffer in list(self._buffers.items()):
+            if not any(buffer.model is model for model in models):
+                del self._buffers[key]
+            else:
+                self._fill(buffer)
+
+    def clear(self):
+        """Drop all sequences e.g. if the length settings of markov changed
+
+        The streams continue: dropped sequences are not drawn again.
+        """
+        for buffer in self._buffers.values():
+            buffer.sequences.clear()
+            buffer.markov = self._worker(buffer.markov._rng)
+
+    def reseed(self, seed: int):
+        """Drop all sequences and streams and restart from `seed`"""
+        self._seed = seed
+        self._buffers = {}
+        self._states = {}
+
+    def get_state(self) -> Dict[PoolKey, Tuple[List[MarkovSequence], Dict[str, Any]]]:
+        """The sequences and stream states of all buffers e.g. for a checkpoint"""
+        states = dict(self._states)
+        for key, buffer in self._buffers.items():
+            states[key] = (
+                list(buffer.sequences),
+                buffer.markov._rng.bit_generator.state,
+            )
+        return states
+
+    def set_state(
+        self, states: Dict[PoolKey, Tuple[List[MarkovSequence], Dict[str, Any]]]
+    ):
+        """Continue from states returned by :meth:`get_state`"""
+        self._buffers = {}
+        self._states = dict(states)
@@ -10,6 +10,18 @@ from .tools.lsystems import LsystemPaths
 from .enums import Observation
 
 
+class _TomlDecoder(toml.TomlDecoder):
+    """Decode inline tables to dicts: the default class is local and can not be
+    pickled (e.g. in a checkpoint or for a worker process)"""
+
+    def get_empty_inline_table(self):
+        return self.get_empty_table()
+
+
+def _toml_loads(content: str) -> Dict[str, Any]:
+    return toml.loads(content, decoder=_TomlDecoder())
+
+
 def _make_dataclass(cls, data_or_cls):
     return cls(**data_or_cls) if type(data_or_cls) is dict else data_or_cls
 
@@ -43,18 +55,47 @@ class OptionsGeneral(OptionsBase):
     mechanics: bool = True
     # render mode  may be bark, observations, zones, reaction_wood, year
     render_mode: str = "bark"
+    # Reuse the shapes of metamers that did not change since the last scene
+    scene_cache: bool = False
+    # If > 0 the scene cache ignores changes of a metamer below this number of
+    # significant digits (see SceneCache). Exact if 0
+    scene_cache_digits: int = 0
     # should be an integer. This is the number of elements of the shapes (e.g., leaf)
     stride_number: int = 5
     # Set to true to enalbe pruning# otherwise false (added by Liqi Han, 11-10-2011)
     pruning: bool = False
     # TODO
     convergence_steps: int = 2
+    # Derive the mechanics until the maximum change of the rotation velocity is below
+    # the tolerance (at most convergence_maximum_steps times). Disabled if 0
+    convergence_tolerance: float = 0.0
+    convergence_maximum_steps: int = 10
+    # Skip the mechanics on days without changes of mass, geometry or rigidity once the
+    # rotation velocity settled
+    skip_unchanged_mechanics: bool = False
+    # Advance through a growth pause (between leaf_out and bud_break) in one step
+    # up to the day before the next event instead of day by day
+    fast_forward: bool = False
+    # Seasonal time step schedule e.g. [{ day = 1, month = 11, dt = 7 }, { day = 1, month = 4, dt = 1 }]
+    # Each entry sets the time step (in days) from its date onward. Steps are shortened
+    # to end on the day before an event or on an output date. Default is one day.
+    time_steps: List[Dict[str, int]] = dc.field(default_factory=lambda: list())
+    # Skip the derivation of lsystems without rules (e.g. axiom and interpretation)
+    fused: bool = False
+    # Keep only the final lstring between days instead of the output of every lsystem
+    lean_lstrings: bool = False
 
 
 @dc.dataclass
 class OptionsOutput(OptionsBase):
     dates: List[Dict[str, int]] = dc.field(default_factory=lambda: list())
     attributes: Dict[str, List[str]] = dc.field(default_factory=lambda: dict())
+    # file name of a trace of wall time and module counts per lsystem derivation
+    # e.g. 'trace.jsonl' or 'trace.csv'. Disabled if empty
+    trace: str = ""
+    # file name of the Markov sequence generation counters (see Simulation.markov_stats)
+    # written on output dates and at the end date e.g. 'markov.json'. Disabled if empty
+    markov_stats: str = ""
 
 
 @dc.dataclass
@@ -63,6 +104,14 @@ class OptionsInput(OptionsBase):
     lpy_path: str = dc.field(
         default_factory=lambda: str(pathlib.Path(__file__).parent.joinpath("lpy"))
     )
+    # Reuse lsystems compiled by previous simulations of the same process
+    lsystem_cache: bool = False
+    # directory of the Markov models (.toml or .npz files, see markov.compile_models)
+    markov_path: str = dc.field(
+        default_factory=lambda: str(
+            pathlib.Path(__file__).parent.joinpath("data", "markov")
+        )
+    )
 
 
 @dc.dataclass
@@ -129,6 +178,12 @@ class OptionsApex(OptionsBase):
 class OptionsMarkov(OptionsBase):
     maximum_length: int = 70  # < 100
     minimum_length: int = 4
+    # Draw sequences conditioned on their length instead of drawing until one is
+    # within bounds
+    exact: bool = False
+    # Number of pre-generated sequences per model and bounds, refilled after each time
+    # step. Disabled if 0
+    pool_size: int = 0
     terminal_fate: Dict[Any, Any] = dc.field(default_factory=lambda: dict())
 
     def __post_init__(self):
@@ -195,7 +250,45 @@ class Options(OptionsBase):
 
     @staticmethod
     def loads(options: str) -> "Options":
-        return Options(**toml.loads(options))
+        return Options(**_toml_loads(options))
 
     def dumps(self) -> str:
         return toml.dumps(dc.asdict(self))
+
+    def _resolve(self, field: str):
+        *path, name = field.split(".")
+        parent: Any = self
+        for key in path:
+            parent = parent[key] if type(parent) is dict else getattr(parent, key, None)
+            if parent is None:
+                raise KeyError(f"Unknown option {field}")
+        if type(parent) is dict:
+            if name not in parent:
+                raise KeyError(f"Unknown option {field}")
+        elif not dc.is_dataclass(parent) or name not in [
+            f.name for f in dc.fields(parent)
+        ]:
+            raise KeyError(f"Unknown option {field}")
+        return parent, name
+
+    def get_field(self, field: str) -> Any:
+        """Get an option by its dotted name e.g. `wood.youngs_modulus`"""
+        parent, name = self._resolve(field)
+        return parent[name] if type(parent) is dict else getattr(parent, name)
+
+    def set_field(self, field: str, value: Any) -> "Options":
+        """Set an option by its dotted name e.g. `wood.youngs_modulus`
+
+        Numerical values are converted to the type of the current value.
+        """
+        parent, name = self._resolve(field)
+        current = parent[name] if type(parent) is dict else getattr(parent, name)
+        if type(current) is float:
+            value = float(value)
+        elif type(current) is int:
+            value = int(round(value))
+        if type(parent) is dict:
+            parent[name] = value
+        else:
+            setattr(parent, name, value)
+        return self
@@ -1,4 +1,5 @@
 from typing import List, Union, Tuple
+from math import ceil
 
 from ..frame import Frame
 from ..enums import Observation
@@ -270,6 +271,12 @@ class ApexData:
         )
 
     def terminal_expansion(self, dt):
+        if dt > 1:
+            # daily expansion stops once the target radius is reached
+            dt = min(
+                dt,
+                ceil((self.target_radius - self.radius) / self.terminal_expansion_rate),
+            )
         self.radius = self.radius + self.terminal_expansion_rate * dt
         self.expansion_days_counter += dt
 
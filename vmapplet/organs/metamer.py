@@ -1,6 +1,6 @@
 from typing import Union
 
-from math import acos
+from math import acos, ceil
 
 from openalea.plantgl.all import Vector3, dot
 
@@ -177,6 +177,8 @@ class MetamerData:
         self.pre_harvest_mass = 0.0  # in g # used to compute rotation_memory
         self.pre_harvest_radius = 0  # in meters
         self.pre_harvest_rotation = Vector3(0.0, 0.0, 0.0)
+        # inputs of the mechanics at the last parameters update (see organ_activity)
+        self.mechanics_inputs = None
 
         """
         The conditional on 'number' is to get around a bug in LPFG.
@@ -259,6 +261,7 @@ class MetamerData:
                 self.leaf.state = LeafState.SCAR
 
             if simulation.events.leaf_fall.active:
+                # a daily probability: an active event forces a one day time step
                 if boolean_event(self.leaf.fall_probability):
                     self.leaf.state = LeafState.SCAR
 
@@ -285,6 +288,19 @@ class MetamerData:
         self.leaf_state = self.leaf.state
         self.leaf_area = self.leaf.area
 
+        if simulation.rotation_convergence.skip_unchanged:
+            mechanics_inputs = (
+                self.length,
+                self.rigidity,
+                self.leaf.mass,
+                self.fruit.mass,
+                self.leaf.state,
+                self.fruit.state,
+            )
+            if mechanics_inputs != self.mechanics_inputs:
+                self.mechanics_inputs = mechanics_inputs
+                simulation.mechanics_dirty = True
+
         return additional_fruit
 
     def update_metamer_parameters(self, simulation, cambial=None):
@@ -338,16 +354,37 @@ class MetamerData:
                 self.hlu.up, self.hlu.heading, self.season_initial_heading
             )
             if r > self.layers[-1].reaction_wood:
-                self.layers[-1].reaction_wood += (
-                    self.wood._reaction_wood_rate
-                    * simulation.dt.days
-                    * (r - self.layers[-1].reaction_wood)
+                if simulation.dt.days == 1:
+                    rate = self.wood._reaction_wood_rate * simulation.dt.days
+                else:
+                    # compound the daily approach to the target over several days
+                    rate = (
+                        1.0
+                        - (1.0 - self.wood._reaction_wood_rate) ** simulation.dt.days
+                    )
+                self.layers[-1].reaction_wood += rate * (
+                    r - self.layers[-1].reaction_wood
                 )
 
         # Growth of internode
-        if self.age < self.internode._elongation_period:
+        if simulation.dt.days == 1:
+            elongation_days = 1 if self.age < self.internode._elongation_period else 0
+        else:
+            # the days of the time step on which the internode is still elongating
+            elongation_days = min(
+                simulation.dt.days,
+                max(
+                    0,
+                    ceil(
+                        self.internode._elongation_period
+                        - (self.age - simulation.dt.days)
+                    )
+                    - 1,
+                ),
+            )
+        if elongation_days > 0:
             self.length += (
-                self.internode.growth_rate(self.zone) * simulation.dt.days
+                self.internode.growth_rate(self.zone) * elongation_days
             )  # TODO this is in meters per day (merge to seconds ? )
 
         # Updating second_moment_of_area
@@ -443,10 +480,17 @@ class MetamerData:
         new_rotation_velocity = self.acting_rotation + self.rotation_memory
         # Hypothesis: The total rotation velocity is the sum of the acting
         # rotation and the shape memory
-        self.rotation_velocity = (
-            new_rotation_velocity * simulation.rotation_convergence.step
-            + self.rotation_velocity * (1.0 - simulation.rotation_convergence.step)
+        step = simulation.rotation_convergence.relaxation(simulation.dt.days)
+        rotation_velocity = new_rotation_velocity * step + self.rotation_velocity * (
+            1.0 - step
         )
+        if simulation.rotation_convergence.tracks_change:
+            # normalize returns the norm of the difference to the previous velocity
+            change = (
+                rotation_velocity - self.rotation_velocity * self.rv_norm
+            ).normalize()
+            simulation.rotation_change = max(simulation.rotation_change, change)
+        self.rotation_velocity = rotation_velocity
 
         self.rv_norm = self.rotation_velocity.normalize()
 
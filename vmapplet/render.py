@@ -0,0 +1,85 @@
+from typing import Any, Optional, Tuple, TYPE_CHECKING
+from collections import Counter
+import dataclasses as dc
+import time
+
+import openalea.plantgl.all as pgl
+
+if TYPE_CHECKING:
+    from .simulation import Simulation
+
+
+def _fingerprint(simulation: "Simulation") -> Tuple[Any, ...]:
+    """The number of modules and the leaf and fruit states of all metamers"""
+    lstring = simulation.lstring
+    states: Counter = Counter()
+    for module in lstring:
+        if module.name == "metamer":
+            metamer = module[0]
+            states[(metamer.leaf.state, metamer.fruit.state)] += 1
+    return (len(lstring), frozenset(states.items()))
+
+
+@dc.dataclass
+class RenderPolicy:
+    """Decide when the scene of a running simulation is (re)rendered
+
+    The scene interpretation runs over the whole lstring and may cost more than a
+    day of growth for large trees. A policy renders at most every `every` days and,
+    if enabled, only on output dates, only if the number of modules or a leaf or fruit
+    state changed or only if rendering took less than `budget` (a fraction) of the
+    wall time so far. Scenes are not rendered during a growth pause unless
+    `growth_pause` is True.
+
+    >>> run(simulation, scene_widget, RenderPolicy(every=7, on_change=True))
+    """
+
+    every: int = 1  # [d]
+    output_dates: bool = False
+    on_change: bool = False
+    budget: Optional[float] = None  # [-] fraction of wall time spent rendering
+    growth_pause: bool = False
+
+    _next_day: int = dc.field(default=0, init=False, repr=False)
+    _fingerprint: Optional[Tuple[Any, ...]] = dc.field(
+        default=None, init=False, repr=False
+    )
+    _render_time: float = dc.field(default=0.0, init=False, repr=False)
+    _start: Optional[float] = dc.field(default=None, init=False, repr=False)
+
+    def should_render(self, simulation: "Simulation") -> bool:
+        if self._start is None:
+            self._start = time.perf_counter()
+
+        if not self.growth_pause:
+            events = simulation.get_active_events()
+            if "growth_pause" in events or "leaf_out" in events:
+                # nothing changes visualy during a growth pause
+                return False
+        if simulation.time_elapsed.days < self._next_day:
+            return False
+        if self.output_dates and not simulation.is_output_date():
+            return False
+        if self.budget is not None and self._render_time > self.budget * (
+            time.perf_counter() - self._start
+        ):
+            return False
+        if self.on_change:
+            fingerprint = _fingerprint(simulation)
+            if fingerprint == self._fingerprint:
+                return False
+            self._fingerprint = fingerprint
+
+        return True
+
+    def render(self, simulation: "Simulation") -> Optional[pgl.Scene]:
+        """The scene of the simulation or None if the policy skips this time step"""
+        if not self.should_render(simulation):
+            return None
+
+        start = time.perf_counter()
+        scene = simulation.get_scene()
+        self._render_time += time.perf_counter() - start
+        self._next_day = simulation.time_elapsed.days + self.every
+
+        return scene
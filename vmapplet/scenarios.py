@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import multiprocessing as mp
+import os
+import pathlib
+
+from .simulation import Simulation
+from .ensemble import RunInfo, _complete, _write_runs
+
+# the grown prefix, inherited (copy-on-write) by forked worker processes
+_prefix: Optional[Simulation] = None
+
+
+def _run_branch(args: Tuple[str, Dict[str, Any], str, int, Optional[str]]) -> RunInfo:
+    name, overrides, output_path, seed, checkpoint = args
+
+    def create() -> Simulation:
+        if checkpoint is None:
+            simulation = _prefix
+            assert simulation is not None, "No simulation prefix in worker process"
+            simulation.output_path = output_path
+        else:
+            simulation = Simulation.restore(checkpoint, output_path)
+        simulation.apply_options(overrides)
+        return simulation
+
+    return _complete(create, RunInfo(seed=seed, output_path=output_path, name=name))
+
+
+def run_scenarios(
+    simulation: Simulation,
+    scenarios: Mapping[str, Mapping[str, Any]],
+    output_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> List[RunInfo]:
+    """Branch a simulation into scenarios that continue from its current date
+
+    The shared prefix is grown once (by advancing `simulation` to the fork date) and
+    each scenario runs in a forked worker process that shares the prefix state
+    copy-on-write. Without the 'fork' start method (e.g. on Windows) the prefix is
+    written to a checkpoint (see :meth:`Simulation.checkpoint`) that each worker
+    restores instead. A scenario applies its option overrides (see
+    :meth:`Simulation.apply_options`) before it continues until the end date.
+    A summary of all runs is written to `scenarios.toml`.
+
+    >>> simulation = Simulation(options)
+    >>> while simulation.date < datetime(1997, 1, 1):
+    ...     simulation.advance()
+    >>> run_scenarios(simulation, {"soft": {"wood.youngs_modulus": 0.8}})
+
+    :param simulation: the simulation advanced to the fork date
+    :param scenarios: option overrides by scenario name
+    :param output_path: a string/path were the scenario directories will be created
+    :param workers: the number of worker processes (default is the number of CPUs)
+    :returns: a list of RunInfo in the order of `scenarios`
+    """
+    global _prefix
+
+    for overrides in scenarios.values():
+        # fail early on unknown fields
+        for field in overrides.keys():
+            simulation.options.get_field(field)
+
+    root = pathlib.Path(output_path or os.getcwd() + "/output")
+    root.mkdir(parents=True, exist_ok=True)
+
+    fork = "fork" in mp.get_all_start_methods()
+    checkpoint = None
+    if not fork:
+        checkpoint = root / "prefix.pickle"
+        simulation.checkpoint(checkpoint)
+
+    names = list(scenarios.keys())
+    infos: List[RunInfo] = []
+    _prefix = simulation
+    try:
+        # a fresh fork of the prefix per scenario: a worker must not be reused
+        with mp.get_context("fork" if fork else None).Pool(
+            workers, maxtasksperchild=1
+        ) as pool:
+            for info in pool.imap_unordered(
+                _run_branch,
+                [
+                    (
+                        name,
+                        dict(scenarios[name]),
+                        str(root / name),
+                        simulation.options.general.seed,
+                        None if checkpoint is None else str(checkpoint),
+                    )
+                    for name in names
+                ],
+            ):
+                if info.error is not None:
+                    print(f"Warning: scenario {info.name} failed")
+                infos.append(info)
+    finally:
+        _prefix = None
+        if checkpoint is not None:
+            checkpoint.unlink()
+
+    infos.sort(key=lambda info: names.index(info.name))
+    _write_runs(root / "scenarios.toml", infos)
+
+    return infos
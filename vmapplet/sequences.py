@@ -331,12 +331,34 @@ def generate_floral_sequence() -> Sequence:
     ]
 
 
+# the (reversed) sequence of each row of a trunk sequence file
+TrunkSequences = Tuple[Tuple[Tuple[None, int], ...], ...]
+# trunk sequence files by path: the table and its sequences
+_trunk_sequences: Dict[str, Tuple[np.ndarray, TrunkSequences]] = {}
+
+
+def _load_trunk_sequences(trunk_seq: str) -> Tuple[np.ndarray, TrunkSequences]:
+    path = get_shared_data_path(trunk_seq)
+    if path not in _trunk_sequences:
+        table = np.loadtxt(path, int, ndmin=2)
+        table.flags.writeable = False
+        sequences = []
+        for row in table.tolist():
+            # a row ends at the first 9
+            if 9 in row:
+                row = row[: row.index(9)]
+            sequences.append(tuple((None, obs) for obs in reversed(row)))
+        _trunk_sequences[path] = (table, tuple(sequences))
+    return _trunk_sequences[path]
+
+
 def generate_trunk(
     trunk_seq="trunk/sequences.seq", select: Union[List[int], int] = 0
 ) -> Sequence:
     """Generate a trunk sequence randomly selected within a list of hard-coded trunk sequences
 
-    Used by :meth:`~openalea.stocatree.sequences.generate_sequence` only
+    Used by :meth:`~openalea.stocatree.sequences.generate_sequence` only. The file is
+    read once per process.
 
     :param list select: the index of the selected trunk in the list of trunk sequence (default is 0).
 
@@ -350,20 +372,12 @@ def generate_trunk(
         select_ = select[0]
     elif type(select) is int:
         select_ = select
-    seqs = np.loadtxt(get_shared_data_path(trunk_seq), int)
-
-    assert 0 <= select_ < len(seqs)
-
-    seq: List[int] = list(seqs[select_])
-    sequence: Sequence = []
-    for obs in seq:
-        if obs == 9:
-            break
-        sequence.append((None, obs))
+    _, sequences = _load_trunk_sequences(trunk_seq)
 
-    sequence.reverse()
+    assert 0 <= select_ < len(sequences)
 
-    return sequence
+    # a new list: sequences are owned by apices
+    return list(sequences[select_])
 
 
 def _generate_random_draw_sequence() -> Sequence:
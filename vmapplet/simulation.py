@@ -1,27 +1,82 @@
-from typing import Dict, Tuple, Optional, Union
+from typing import Any, Callable, Dict, Mapping, Tuple, Optional, Union
 import pathlib
 import dataclasses as dc
+import copy
 from datetime import datetime, timedelta
 import random
 import io
+import json
 import os
 import pickle
+import weakref
 
 from openalea.mtg.io import (
     axialtree2mtg,
     # TODO: Try lpy2mtg
 )
-import toml
 import numpy as np
 
 from .organs.tree import Tree
+from .organs.wood import Wood
+from .organs.internode import Internode
 from .organs import get_scale
-from .tools.lsystems import LsystemPaths, Lsystems
+from .tools.lsystems import (
+    LsystemPaths,
+    Lsystems,
+    LsystemsConfig,
+    lstring_to_modules,
+    modules_to_lstring,
+)
 from .tools.simulation import SimulationInterface, RotationConvergence
+from .tools.trace import Tracer
+from .tools.scene import SceneCache
 from .tools.read_function import ReadFunction
 from .tools.file_tools import get_shared_data_path
 from .options import Options
-from .markov import Markov, MarkovModel
+from .markov import (
+    Markov,
+    MarkovModel,
+    SequencePool,
+    SequenceStats,
+    StatsKey,
+    load_models,
+)
+
+
+# bump if the checkpoint content changes
+_CHECKPOINT_VERSION = 1
+
+# options (or sections) read once when a Simulation is created
+_FIXED_OPTIONS = (
+    "general.date_start",
+    "general.fused",
+    "general.lean_lstrings",
+    "general.scene_cache",
+    "general.scene_cache_digits",
+    "input.lpy_files",
+    "input.lpy_path",
+    "input.lsystem_cache",
+)
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """Store objects shared with the L-Py namespaces by name instead of by value"""
+
+    def __init__(self, file, shared: Dict[str, Any]):
+        super().__init__(file)
+        self._shared = {id(obj): name for name, obj in shared.items()}
+
+    def persistent_id(self, obj):
+        return self._shared.get(id(obj))
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, shared: Dict[str, Any]):
+        super().__init__(file)
+        self._shared = shared
+
+    def persistent_load(self, pid):
+        return self._shared[pid]
 
 
 def _to_full_path(root: pathlib.Path, paths: LsystemPaths) -> LsystemPaths:
@@ -33,6 +88,13 @@ def _to_full_path(root: pathlib.Path, paths: LsystemPaths) -> LsystemPaths:
     }
 
 
+def _weak_method(method: Callable[[], Any]) -> Callable[[], Any]:
+    """Call `method` without keeping its instance alive e.g. from the lsystems config
+    (a reference cycle would keep a cached lsystem from being reused)"""
+    method_ref = weakref.WeakMethod(method)
+    return lambda: method_ref()()
+
+
 class Simulation(SimulationInterface):
     """Instantiate a VMAppleT Simulation
 
@@ -42,12 +104,26 @@ class Simulation(SimulationInterface):
 
     options: Options
     rotation_convergence: RotationConvergence
+    # maximum change of the rotation velocity in the last mechanics derivation
+    rotation_change: float = 0.0
+    # number of mechanics derivations in the last time step (adaptive convergence)
+    convergence_iterations: int = 0
+    # set if an input of the mechanics changed since their last derivation
+    mechanics_dirty: bool = True
+    # maximum change of the rotation velocity in all sweeps of the last derivation
+    _mechanics_change: float = 0.0
 
     _lsystems: Lsystems
     _markov: Markov
     _markov_models: Dict[Tuple[str, int], MarkovModel]
     _output_path: pathlib.Path
     _rng: np.random.Generator
+    _tree: Tree
+    _wood: Wood
+    _internode: Internode
+    _lsystems_config: LsystemsConfig
+    _tracer: Optional[Tracer]
+    _scene_cache: Optional[SceneCache]
 
     # calculated from events: between leaf_out and bud_break
     _growth_pause: bool = False
@@ -56,7 +132,7 @@ class Simulation(SimulationInterface):
         if isinstance(options, Options):
             self.options = options
         else:
-            self.options = Options(**toml.loads(options))
+            self.options = Options.loads(options)
 
         self._output_path = pathlib.Path(output_path or os.getcwd() + "/output")
 
@@ -68,47 +144,224 @@ class Simulation(SimulationInterface):
         self._rng = np.random.default_rng(self.options.general.seed)
 
         for name, event in dc.asdict(self.options.events).items():
-            self.events.add_event(
-                name,
-                datetime(
-                    self.options.general.date_start.year, event["month"], event["day"]
-                ),
-                duration=timedelta(event["duration"]),
-            )
+            self._add_event(name, event)
 
         self._markov = Markov(
             generator=self._rng,
             minimum_length=self.options.markov.minimum_length,
             maximum_length=self.options.markov.maximum_length,
+            exact=self.options.markov.exact,
         )
+        self._set_sequence_pool()
 
-        self._markov_models = {}
-        for path in os.listdir(get_shared_data_path("markov")):
-            path = pathlib.Path(get_shared_data_path("markov")) / path
-            if path.is_file() and path.suffix == ".toml":
-                with io.open(path) as file:
-                    model = MarkovModel(**toml.loads(file.read()))
-                    self._markov_models[(model.length, model.year)] = model
+        self._markov_models = load_models(self.options.input.markov_path)
 
         tree = Tree(**self.options.tree)
+        self._tree = tree
+        self._wood = Wood(**self.options.wood)
+        self._internode = Internode(**self.options.internode)
 
         lpy_path = self.options.input.lpy_path
         lpy_files = self.options.input.lpy_files
-        # namspace available in L-Py files
+        lsystem_cache = self.options.input.lsystem_cache
+        # namspace available in L-Py files. A cached lsystem must not keep the
+        # simulation alive (see compile_lsystem)
         lpy_options = dict(
-            options=self.options, simulation=self, markov=self._markov, tree=tree
+            options=self.options,
+            simulation=weakref.proxy(self) if lsystem_cache else self,
+            markov=self._markov,
+            tree=tree,
         )
 
+        self._lsystems_config = dict(mechanics=dict())
+        self._set_rotation_convergence()
+        self._tracer = Tracer() if self.options.output.trace else None
         self._lsystems = Lsystems(
             _to_full_path(pathlib.Path(lpy_path), lpy_files),
             lpy_options,
-            dict(mechanics=dict(steps=self.options.general.convergence_steps)),
+            self._lsystems_config,
+            tracer=self._tracer,
+            fused=self.options.general.fused,
+            lean=self.options.general.lean_lstrings,
+            cache=lsystem_cache,
         )
 
         self._func_leaf_area_init(get_shared_data_path("lpy/functions.fset"))
+        self._scene_cache = (
+            SceneCache(
+                self._lsystems.sceneInterpretation,
+                self.options.general.scene_cache_digits or None,
+            )
+            if self.options.general.scene_cache
+            else None
+        )
+
+    def _set_sequence_pool(self):
+        self._markov.set_pool(
+            SequencePool(
+                self._markov,
+                self.options.general.seed,
+                self.options.markov.pool_size,
+            )
+            if self.options.markov.pool_size > 0
+            else None
+        )
+
+    def _set_rotation_convergence(self):
+        general = self.options.general
         self.rotation_convergence = RotationConvergence(
-            steps=self.options.general.convergence_steps
+            steps=general.convergence_steps,
+            tolerance=general.convergence_tolerance,
+            maximum_steps=general.convergence_maximum_steps,
+            skip_unchanged=general.skip_unchanged_mechanics,
+        )
+        mechanics = self._lsystems_config["mechanics"]
+        mechanics.clear()
+        if self.rotation_convergence.adaptive:
+            mechanics.update(
+                steps=general.convergence_maximum_steps,
+                converged=_weak_method(self._rotation_converged),
+            )
+        else:
+            mechanics.update(steps=general.convergence_steps)
+        if self.rotation_convergence.skip_unchanged:
+            mechanics.update(skip=_weak_method(self._skip_mechanics))
+        self.mechanics_dirty = True
+
+    def _rotation_converged(self) -> bool:
+        self.convergence_iterations += 1
+        self._mechanics_change = max(self._mechanics_change, self.rotation_change)
+        converged = self.rotation_change < self.rotation_convergence.tolerance
+        self.rotation_change = 0.0
+        return converged
+
+    def _skip_mechanics(self) -> bool:
+        """True if nothing changed since the mechanics settled"""
+        change = max(self._mechanics_change, self.rotation_change)
+        skip = (
+            not self.mechanics_dirty
+            and change < self.rotation_convergence.settled_tolerance
+            # change the rotation memory without a change of the mechanics inputs
+            and not self.events.pre_harvest.active
+            and not self.events.harvest.active
         )
+        if not skip:
+            self.mechanics_dirty = False
+            self._mechanics_change = 0.0
+            self.rotation_change = 0.0
+        return skip
+
+    def _add_event(self, name: str, event: Dict[str, int]):
+        self.events.add_event(
+            name,
+            datetime(
+                self.options.general.date_start.year, event["month"], event["day"]
+            ),
+            duration=timedelta(event["duration"]),
+        )
+
+    def apply_options(self, overrides: Mapping[str, Any]):
+        """Change options of a running simulation by dotted name e.g. `wood.youngs_modulus`
+
+        Changes apply from the current date onward. Objects derived from the options
+        (tree, wood, internode, events, markov bounds, seed) are updated in place because
+        they are shared with the L-Py namespaces and existing metamers. The Markov models
+        are reloaded if `input.markov_path` changes.
+
+        Raises a ValueError naming the fields that cannot be changed on a running
+        simulation (see `_FIXED_OPTIONS`). The options are unchanged in that case.
+        """
+        options = copy.deepcopy(self.options)
+        for field, value in overrides.items():
+            options.set_field(field, value)
+        changed = [
+            field
+            for field in overrides
+            if options.get_field(field) != self.options.get_field(field)
+        ]
+        fixed = [
+            field
+            for field in changed
+            if any(
+                field == name or field.startswith(name + ".") for name in _FIXED_OPTIONS
+            )
+        ]
+        if "output.trace" in changed and (
+            not options.output.trace or not self.options.output.trace
+        ):
+            # the tracer is passed to the lsystems when they are created
+            fixed.append("output.trace")
+        if fixed:
+            raise ValueError(
+                f"Options {', '.join(fixed)} cannot be changed on a running simulation"
+            )
+        RotationConvergence(
+            steps=options.general.convergence_steps,
+            tolerance=options.general.convergence_tolerance,
+            maximum_steps=options.general.convergence_maximum_steps,
+        )
+
+        if "input.markov_path" in changed:
+            markov_models = load_models(options.input.markov_path)
+
+        for field in changed:
+            self.options.set_field(field, options.get_field(field))
+
+        sections = set(field.split(".")[0] for field in changed)
+        if "tree" in sections:
+            counters = (
+                "trunk_radius",
+                "trunk_cross_sectional_area",
+                "fruit_load",
+                "growth_units",
+                "first_branches",
+                "fruits",
+            )
+            tree = Tree(**self.options.tree)
+            self._tree.__dict__.update(
+                {k: v for k, v in tree.__dict__.items() if k not in counters}
+            )
+        if "wood" in sections:
+            self._wood.__dict__.update(Wood(**self.options.wood).__dict__)
+        if "internode" in sections:
+            self._internode.__dict__.update(
+                Internode(**self.options.internode).__dict__
+            )
+        if "events" in sections:
+            for name, event in dc.asdict(self.options.events).items():
+                active = getattr(self.events, name).active
+                self.events.remove_event(name)
+                self._add_event(name, event)
+                getattr(self.events, name)._active = active
+        if "markov" in sections:
+            self._markov._minimum_length = self.options.markov.minimum_length
+            self._markov._maximum_length = self.options.markov.maximum_length
+            self._markov._exact = self.options.markov.exact
+            if self._markov.pool is not None:
+                self._markov.pool.clear()
+        if "input.markov_path" in changed:
+            # set on the Markov instance by the next advance
+            self._markov_models = markov_models
+            if self._markov.pool is not None:
+                self._markov.pool.clear()
+        if "markov.pool_size" in changed:
+            self._set_sequence_pool()
+        if any(
+            field.startswith("general.convergence_")
+            or field == "general.skip_unchanged_mechanics"
+            for field in changed
+        ):
+            self._set_rotation_convergence()
+        if "general.date_end" in changed:
+            date_end = self.options.general.date_end
+            self._ending_date = datetime(date_end.year, date_end.month, date_end.day)
+        if "general.seed" in changed:
+            random.seed(self.options.general.seed)
+            self._rng.bit_generator.state = np.random.default_rng(
+                self.options.general.seed
+            ).bit_generator.state
+            if self._markov.pool is not None:
+                self._markov.pool.reseed(self.options.general.seed)
 
     def _func_leaf_area_init(
         self, filename="lpy/functions.fset", func_name="leaf_area"
@@ -183,17 +436,238 @@ class Simulation(SimulationInterface):
 
     def advance(self):
         """
-        Advance simulation by one day and derive all lsystems
+        Advance simulation by one time step and derive all lsystems
+
+        The time step is one day unless a seasonal schedule is set in
+        `general.time_steps` or `general.fast_forward` is enabled and the tree is in a
+        growth pause. Steps longer than a day never span an active event, an output
+        date or a change of the schedule.
         """
-        super().advance()
-        self._set_markov_model()
-        lstring = self._lsystems.derive()
-        for day_month in self.options.output.dates:
-            if (
-                day_month["day"] == self.calendar.day
-                and day_month["month"] == self.calendar.month
+        self.calendar.dt = self._step_days()
+        self.convergence_iterations = 0
+        try:
+            super().advance()
+            self._set_markov_model()
+            lstring = self._lsystems.derive()
+        finally:
+            self.calendar.dt = 1
+        if self._markov.pool is not None:
+            # between bud breaks
+            self._markov.pool.refill()
+        if self._tracer is not None:
+            self._tracer.write(self._output_path / self.options.output.trace, self.date)
+        if self.is_output_date():
+            self._write_output(lstring)
+        if self.options.output.markov_stats and (
+            self.is_output_date() or self.date >= self.ending_date
+        ):
+            self._write_markov_stats()
+
+    def is_output_date(self) -> bool:
+        """True if the current date is one of the `output.dates`"""
+        return any(
+            day_month["day"] == self.calendar.day
+            and day_month["month"] == self.calendar.month
+            for day_month in self.options.output.dates
+        )
+
+    def _next_date(self, day_month: Mapping[str, int]) -> Optional[datetime]:
+        """The next date after the current date on a day and month"""
+        for year in (self.date.year, self.date.year + 1):
+            try:
+                date = datetime(year, day_month["month"], day_month["day"])
+            except ValueError:
+                # February 29th
+                continue
+            if date > self.date:
+                return date
+        return None
+
+    def _scheduled_days(self) -> int:
+        """The time step of the seasonal schedule at the current date"""
+        time_steps = sorted(
+            self.options.general.time_steps, key=lambda t: (t["month"], t["day"])
+        )
+        if not time_steps:
+            return 1
+        # the last entry of the previous year applies until the first entry
+        days = time_steps[-1]["dt"]
+        for time_step in time_steps:
+            if (time_step["month"], time_step["day"]) <= (
+                self.date.month,
+                self.date.day,
             ):
-                self._write_output(lstring)
+                days = time_step["dt"]
+        return days
+
+    def _step_days(self) -> int:
+        """Number of days of the next time step
+
+        Always 1 while an event is active: organs apply the daily probabilities and
+        changes of an event (e.g. leaf fall, harvest) once per time step.
+        """
+        days: Optional[int] = self._scheduled_days()
+        if self.options.general.fast_forward and (
+            "growth_pause" in self.get_active_events()
+        ):
+            days = None
+        if days == 1 or any(event.active for event in self.events):
+            return 1
+
+        target = self.ending_date
+        if days is not None:
+            target = min(target, self.date + timedelta(days))
+        next_active_date = self.events.next_active_date(self.date)
+        if next_active_date is not None:
+            # events must be active in a daily step to trigger e.g. bud break
+            target = min(target, next_active_date - timedelta(1))
+        for day_month in self.options.output.dates + self.options.general.time_steps:
+            date = self._next_date(day_month)
+            if date is not None:
+                target = min(target, date)
+
+        return max(1, (target - self.date).days)
+
+    def checkpoint(self, path: Union[str, pathlib.Path]):
+        """Write the full simulation state to `path`
+
+        A simulation restored with :meth:`restore` continues bit-identically.
+        """
+        header = dict(
+            version=_CHECKPOINT_VERSION,
+            options=self.options,
+            output_path=str(self._output_path),
+        )
+        state = dict(
+            modules=lstring_to_modules(self._lsystems.lstring),
+            derivation_steps=self._lsystems.get_derivation_steps(),
+            date=self.calendar.date,
+            dt=self.calendar.dt,
+            year=self.calendar._year,
+            time_elapsed=self._time_elapsed,
+            year_no=self._year_no,
+            events={event.name: event.active for event in self.events},
+            growth_pause=self._growth_pause,
+            tree=self._tree.__dict__,
+            rng=self._rng.bit_generator.state,
+            random=random.getstate(),
+            sequence_pool=(
+                self._markov.pool.get_state() if self._markov.pool is not None else None
+            ),
+            markov_stats=self._markov.stats,
+            mechanics_dirty=self.mechanics_dirty,
+            mechanics_change=self._mechanics_change,
+            rotation_change=self.rotation_change,
+        )
+        with io.open(path, "wb") as file:
+            pickle.dump(header, file)
+            _CheckpointPickler(file, self._shared_objects()).dump(state)
+
+    def _shared_objects(self) -> Dict[str, Any]:
+        return dict(wood=self._wood, internode=self._internode)
+
+    @classmethod
+    def restore(
+        cls, path: Union[str, pathlib.Path], output_path: Optional[str] = None
+    ) -> "Simulation":
+        """Create a Simulation from a checkpoint written by :meth:`checkpoint`
+
+        :param path: the checkpoint file
+        :param output_path: overrides the output path stored in the checkpoint
+        """
+        with io.open(path, "rb") as file:
+            header = pickle.load(file)
+            if header.get("version") != _CHECKPOINT_VERSION:
+                raise ValueError(
+                    f"Unsupported checkpoint version {header.get('version')}"
+                )
+            simulation = cls(header["options"], output_path or header["output_path"])
+            state = _CheckpointUnpickler(file, simulation._shared_objects()).load()
+
+        simulation._lsystems.reset(
+            modules_to_lstring(state["modules"]), state["derivation_steps"]
+        )
+        simulation.calendar.date = state["date"]
+        simulation.calendar._dt = state["dt"]
+        simulation.calendar._year = state["year"]
+        simulation._time_elapsed = state["time_elapsed"]
+        simulation._year_no = state["year_no"]
+        for event in simulation.events:
+            event._active = state["events"][event.name]
+        simulation._growth_pause = state["growth_pause"]
+        # update in place: the tree instance is shared with the L-Py namespaces
+        simulation._tree.__dict__.update(state["tree"])
+        simulation._rng.bit_generator.state = state["rng"]
+        random.setstate(state["random"])
+        if simulation._markov.pool is not None and state.get("sequence_pool"):
+            simulation._markov.pool.set_state(state["sequence_pool"])
+        # in place: shared with the workers of the sequence pool
+        simulation._markov.stats.update(state.get("markov_stats", {}))
+        # decides if the mechanics are skipped (general.skip_unchanged_mechanics)
+        simulation.mechanics_dirty = state.get("mechanics_dirty", True)
+        simulation._mechanics_change = state.get("mechanics_change", 0.0)
+        simulation.rotation_change = state.get("rotation_change", 0.0)
+
+        return simulation
+
+    def _write_markov_stats(self):
+        path = self._output_path / self.options.output.markov_stats
+        path.parent.mkdir(parents=True, exist_ok=True)
+        records = [
+            dict(
+                year=year,
+                length=length,
+                lower_bound=lower_bound,
+                upper_bound=upper_bound,
+                **dc.asdict(stats),
+            )
+            for (year, length, lower_bound, upper_bound), stats in sorted(
+                self.markov_stats.items()
+            )
+        ]
+        with io.open(path, "w") as file:
+            json.dump(records, file, indent=2)
+
+    @property
+    def markov_stats(self) -> Dict[StatsKey, SequenceStats]:
+        """Counters of the Markov sequence generation since the start of the simulation
+        by model year, model length and bounds"""
+        return self._markov.stats
+
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        """The tracer of the lsystem derivations if `output.trace` is set"""
+        return self._tracer
+
+    @property
+    def tree(self) -> Tree:
+        return self._tree
+
+    @property
+    def wood(self) -> Wood:
+        return self._wood
+
+    @property
+    def internode(self) -> Internode:
+        return self._internode
+
+    @property
+    def output_path(self) -> pathlib.Path:
+        return self._output_path
+
+    @output_path.setter
+    def output_path(self, output_path: Union[str, pathlib.Path]):
+        self._output_path = pathlib.Path(output_path)
+
+    @property
+    def lstring(self):
+        """The current lstring"""
+        return self._lsystems.lstring
 
     def get_scene(self):
+        if self._scene_cache is not None:
+            return self._scene_cache.scene(
+                self._lsystems.lstring,
+                (self.options.general.render_mode, self.events.autumn.active),
+            )
         return self._lsystems.sceneInterpretation()
@@ -0,0 +1,149 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, Union
+import concurrent.futures as cf
+import copy
+import csv
+import io
+import itertools
+import os
+import pathlib
+
+import numpy as np
+
+from .options import Options
+from .ensemble import RunInfo, SUMMARY_FIELDS, _run
+
+Sample = Dict[str, Any]
+
+
+def grid(axes: Mapping[str, Iterable[Any]]) -> List[Sample]:
+    """Full factorial combination of values per dotted option field
+
+    Ranges are grids with a single axis.
+
+    >>> grid(
+    ...     {
+    ...         "wood.youngs_modulus": [1.0, 1.1],
+    ...         "tree.branching_angle": range(30, 60, 15),
+    ...     }
+    ... )
+    """
+
+    fields = list(axes.keys())
+    return [
+        dict(zip(fields, values))
+        for values in itertools.product(*[list(axis) for axis in axes.values()])
+    ]
+
+
+def latin_hypercube(
+    bounds: Mapping[str, Tuple[float, float]], samples: int, seed: int = 0
+) -> List[Sample]:
+    """Latin-hypercube samples of dotted option fields within [lower, upper] bounds
+
+    >>> latin_hypercube({"fruit.probability": (0.1, 0.5)}, samples=10)
+    """
+
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for field, (lower, upper) in bounds.items():
+        u = (rng.permutation(samples) + rng.random(samples)) / samples
+        columns[field] = lower + u * (upper - lower)
+
+    return [
+        {field: columns[field][i].item() for field in columns} for i in range(samples)
+    ]
+
+
+def _run_sample(options: Options, sample: Sample, output_path: str) -> RunInfo:
+    options = copy.deepcopy(options)
+    for field, value in sample.items():
+        options.set_field(field, value)
+    return _run(options, output_path)
+
+
+def run_sweep(
+    options: Union[str, Options],
+    samples: Iterable[Sample],
+    results_path: str,
+    output_path: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """Run one simulation per sample of option values in a pool of worker processes
+
+    A row with the sample values and a summary of the run is appended to the csv file
+    `results_path` as soon as a run finishes. An existing file must have the same
+    columns (i.e. come from a sweep of the same fields) and the run indices continue
+    after its last run. Each run writes its output into a separate directory
+    `run_<index>` below `output_path`.
+
+    :param options: a string (toml) or an Options instance used as base for all runs
+    :param samples: dicts of dotted option fields and values e.g. from :func:`grid`
+        or :func:`latin_hypercube`
+    :param results_path: the csv file to append the results to
+    :param output_path: a string/path were the run directories will be created
+    :param workers: the number of worker processes (default is the number of CPUs)
+    :returns: the number of failed runs
+    :raises ValueError: if the columns of an existing `results_path` differ
+    """
+
+    if not isinstance(options, Options):
+        options = Options.loads(options)
+
+    samples = list(samples)
+    if not samples:
+        return 0
+    fields = list(samples[0].keys())
+    for sample in samples:
+        if list(sample.keys()) != fields:
+            raise ValueError("All samples in a sweep must have the same fields")
+        # fail early on unknown fields
+        for field in fields:
+            options.get_field(field)
+
+    root = pathlib.Path(output_path or os.getcwd() + "/output")
+    root.mkdir(parents=True, exist_ok=True)
+
+    columns = ["run", *fields, "seed", "days", "elapsed", *SUMMARY_FIELDS, "error"]
+    failures = 0
+    first = 0
+    header = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    if not header:
+        with io.open(results_path, newline="") as file:
+            reader = csv.reader(file)
+            if next(reader, []) != columns:
+                raise ValueError(
+                    f"The columns of {results_path} differ from the columns of this "
+                    f"sweep ({', '.join(columns)})"
+                )
+            # run directories of previous sweeps must not be reused
+            first = 1 + max((int(row[0]) for row in reader if row), default=-1)
+    with io.open(results_path, "a", newline="") as file, cf.ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor:
+        writer = csv.DictWriter(file, fieldnames=columns, restval="")
+        if header:
+            writer.writeheader()
+        futures = {
+            executor.submit(_run_sample, options, sample, str(root / f"run_{i}")): i
+            for i, sample in enumerate(samples, first)
+        }
+        for future in cf.as_completed(futures):
+            i = futures[future]
+            info = future.result()
+            if info.error is not None:
+                failures += 1
+                print(f"Warning: run {i} failed")
+            writer.writerow(
+                dict(
+                    run=i,
+                    **samples[i - first],
+                    seed=info.seed,
+                    days=info.days,
+                    elapsed=info.elapsed,
+                    **info.summary,
+                    error="" if info.error is None else info.error.splitlines()[-1],
+                )
+            )
+            file.flush()
+
+    return failures
@@ -1,11 +1,115 @@
-from typing import Any, Union, Optional, Dict, List
+from typing import Any, Callable, Union, Optional, Dict, List, Tuple
+import dataclasses as dc
+import io
+import os
+import pathlib
+import re
+import time
+import weakref
 
 import openalea.lpy as lpy
 import openalea.plantgl.all as pgl
 
+from .trace import Tracer
+
 # a (optionaly nested) dict of paths to lsystem files
 LsystemPaths = Dict[str, Union[str, "LsystemPaths"]]
 Lstrings = Dict[str, Union[lpy.Lstring, "Lstrings"]]
+# a picklable representation of an lstring: a list of module names and arguments
+Modules = List[Tuple[str, List[Any]]]
+# settings of nested Lsystems by name e.g. dict(mechanics=dict(steps=2))
+LsystemsConfig = Dict[str, Dict[str, Union[int, float, str, Callable[[], bool]]]]
+# the derivation step of an Lsystems followed by the steps of nested Lsystems
+DerivationSteps = List[Union[int, "DerivationSteps"]]
+
+
+def lstring_to_modules(lstring: lpy.Lstring) -> Modules:
+    return [(module.name, list(module.args)) for module in lstring]
+
+
+def modules_to_lstring(modules: Modules) -> lpy.Lstring:
+    lstring = lpy.Lstring()
+    for name, args in modules:
+        lstring.append(lpy.ParamModule(name, *args))
+    return lstring
+
+
+_SECTIONS = ("production:", "decomposition:", "interpretation:", "homomorphism:")
+_DERIVATION_HOOK = re.compile(r"def\s+(Start|End|StartEach|EndEach)\s*\(")
+
+
+def is_identity(path: str) -> bool:
+    """True if a derivation of the lsystem in `path` leaves the lstring unchanged
+
+    That is the case if the file has no production or decomposition rules and no
+    functions called during a derivation (Start, End, StartEach, EndEach).
+    """
+    section = None
+    with io.open(path) as file:
+        for line in file:
+            stripped = line.strip()
+            if _DERIVATION_HOOK.match(stripped):
+                return False
+            if not stripped or stripped.startswith("#") or line[0].isspace():
+                continue
+            if stripped in _SECTIONS or stripped == "endlsystem":
+                section = stripped
+            elif section in ("production:", "decomposition:"):
+                # a rule or anything else we do not know how to derive
+                return False
+    return True
+
+
+@dc.dataclass
+class _Compiled:
+    lsystem: lpy.Lsystem
+    owner: "weakref.ref[Any]"
+
+
+# compiled lsystems by path and modification time, shared by all Lsystems of a process
+_compiled: Dict[Tuple[str, float], List[_Compiled]] = {}
+
+
+def _owner(lsystem: lpy.Lsystem, context: Dict[str, Any], owner: Any):
+    """A weak reference to `owner` that drops `context` from the namespace of
+    `lsystem` once the owner is gone"""
+
+    def release(_):
+        lsystem.context().updateNamespace({name: None for name in context})
+
+    return weakref.ref(owner, release)
+
+
+def compile_lsystem(path: str, context: Dict[str, Any], owner: Any) -> lpy.Lsystem:
+    """The lsystem of `path` from a process wide cache of compiled lsystems
+
+    A cached lsystem is reused if its file has not been modified since and its
+    previous owner is gone. Its namespace is then updated with `context`. An lsystem
+    with an axiom is not cached since the axiom is evaluated when it is compiled.
+    The context is dropped from the namespace of a cached lsystem when its owner is
+    gone. Until then the cache keeps it alive: it must not reference the owner (use a
+    weakref.proxy) or the lsystem is never released.
+
+    :param path: the path of the lpy file
+    :param context: the namespace available in the lpy file
+    :param owner: the lsystem is not reused as long as owner is alive
+    """
+    path = str(pathlib.Path(path).resolve())
+    key = (path, os.path.getmtime(path))
+    for stale in [k for k in _compiled.keys() if k[0] == path and k != key]:
+        del _compiled[stale]
+
+    entries = _compiled.setdefault(key, [])
+    for entry in entries:
+        if entry.owner() is None:
+            entry.lsystem.context().updateNamespace(context)
+            entry.owner = _owner(entry.lsystem, context, owner)
+            return entry.lsystem
+
+    lsystem = lpy.Lsystem(path, context)
+    if len(lsystem.axiom) == 0:
+        entries.append(_Compiled(lsystem, _owner(lsystem, context, owner)))
+    return lsystem
 
 
 class Lsystems:
@@ -15,11 +119,14 @@ class Lsystems:
 
     _lsystems: List[Union[lpy.Lsystem, "Lsystems"]]
     _name: str
-    _config: Dict[str, Dict[str, Union[int, float, str]]]
-    _lstrings: List[lpy.Lstring]
+    _config: LsystemsConfig
+    _lstrings: List[Optional[lpy.Lstring]]
+    _kept: List[bool]
     _keys: List[str]
     _derivation_step: int
     _axiom: lpy.Lstring
+    _tracer: Optional[Tracer]
+    _identities: List[bool]
 
     @property
     def derivation_step(self) -> int:
@@ -29,6 +136,11 @@ class Lsystems:
     def axiom(self) -> lpy.Lstring:
         return self._axiom
 
+    @property
+    def lstring(self) -> lpy.Lstring:
+        """The lstring of the last derived lsystem"""
+        return self._lstrings[-1]
+
     @property
     def lstrings(self) -> Lstrings:
         lstrings = {}
@@ -36,7 +148,7 @@ class Lsystems:
         for (i, key), lstr in zip(enumerate(self._keys), self._lstrings):
             if type(self._lsystems[i]) is Lsystems:
                 lstrings[key] = self._lsystems[i].lstrings
-            else:
+            elif lstr is not None:
                 lstrings[key] = lstr
 
         return lstrings
@@ -45,26 +157,69 @@ class Lsystems:
         self,
         paths: LsystemPaths,
         context: Dict[str, Any] = {},
-        config: Dict[str, Dict[str, Union[int, float, str]]] = {},
+        config: LsystemsConfig = {},
         name: str = "",
+        tracer: Optional[Tracer] = None,
+        fused: bool = False,
+        lean: bool = False,
+        cache: bool = False,
     ):
         """
         The config parameter is somewhat experimental. Currently just 'steps'
-        is used to derive 'mechanics' 'steps' times
+        is used to derive 'mechanics' 'steps' times. If 'converged' is a function
+        all lsystems are derived one step at a time until it returns True (at most
+        'steps' times). If 'skip' is a function and returns True the lsystems are not
+        derived at all
+
+        If a tracer is passed each derivation of an lsystem is recorded by its
+        path e.g. 'mechanics/forward'
+
+        If fused is True lsystems without rules (see :func:`is_identity`) are not
+        derived: their input lstring is passed on to the next lsystem
+
+        If lean is True only the final lstring is kept between derivations and
+        :attr:`lstrings` contains just that one
+
+        If cache is True compiled lsystems are taken from (and returned to) a process
+        wide cache (see :func:`compile_lsystem`)
         """
 
         self._lsystems = []
+        self._identities = []
         self._name = name
         self._config = config
+        self._tracer = tracer
         for name, path_or_paths in paths.items():
             if type(path_or_paths) is dict:
-                self._lsystems.append(Lsystems(path_or_paths, context, config, name))
+                self._lsystems.append(
+                    Lsystems(
+                        path_or_paths,
+                        context,
+                        config,
+                        name,
+                        tracer,
+                        fused,
+                        lean,
+                        cache,
+                    )
+                )
+                self._identities.append(False)
             else:
-                self._lsystems.append(lpy.Lsystem(path_or_paths, context))
+                self._lsystems.append(
+                    compile_lsystem(path_or_paths, context, self)
+                    if cache
+                    else lpy.Lsystem(path_or_paths, context)
+                )
+                self._identities.append(fused and is_identity(path_or_paths))
 
+        # nested Lsystems pass their final lstring on to the parent
+        self._kept = [
+            not lean or (not self._name and i == len(self._lsystems) - 1)
+            for i in range(len(self._lsystems))
+        ]
         if self._lsystems:
             self._axiom = self._lsystems[0].axiom
-            self._lstrings = [self._axiom] * len(self._lsystems)
+            self._keep(self._axiom)
         self._keys = list(paths.keys())
         self._derivation_step = 0
 
@@ -78,18 +233,79 @@ class Lsystems:
         steps = steps or 1
         lstring = lstring or self._lstrings[-1]
 
-        if self._name in self._config and "steps" in self._config[self._name]:
-            steps = int(self._config[self._name]["steps"])
+        config = self._config.get(self._name, {})
+        skip = config.get("skip")
+        if callable(skip) and skip():
+            # the lstring is passed on unchanged
+            self._keep(lstring)
+            return lstring
+
+        if "steps" in config:
+            steps = int(config["steps"])
             step = self._derivation_step
 
-        for i, lsystem in enumerate(self._lsystems):
-            lstring = lsystem.derive(lstring, step, steps)
-            self._lstrings[i] = lstring
+        converged = config.get("converged")
+        if callable(converged):
+            # derive all lsystems one step at a time until converged, at most steps times
+            iterations = 0
+            while iterations < steps:
+                lstring = self._derive_lsystems(lstring, step + iterations, 1)
+                iterations += 1
+                if converged():
+                    break
+            steps = iterations
+        else:
+            lstring = self._derive_lsystems(lstring, step, steps)
 
         self._derivation_step += steps
 
         return lstring
 
+    def _derive_lsystems(
+        self, lstring: lpy.Lstring, step: int, steps: int
+    ) -> lpy.Lstring:
+        for i, lsystem in enumerate(self._lsystems):
+            if self._identities[i]:
+                # the lstring is passed on unchanged
+                self._lstrings[i] = lstring if self._kept[i] else None
+                continue
+            if self._tracer is None or type(lsystem) is Lsystems:
+                lstring = lsystem.derive(lstring, step, steps)
+            else:
+                start = time.perf_counter()
+                lstring = lsystem.derive(lstring, step, steps)
+                self._tracer.record(
+                    f"{self._name}/{self._keys[i]}" if self._name else self._keys[i],
+                    time.perf_counter() - start,
+                    steps,
+                    lstring,
+                )
+            self._lstrings[i] = lstring if self._kept[i] else None
+
+        return lstring
+
+    def _keep(self, lstring: lpy.Lstring):
+        """Use lstring as the lstring of all (kept) lsystems"""
+        self._lstrings = [lstring if kept else None for kept in self._kept]
+
+    def get_derivation_steps(self) -> DerivationSteps:
+        return [self._derivation_step] + [
+            lsystem.get_derivation_steps()
+            for lsystem in self._lsystems
+            if type(lsystem) is Lsystems
+        ]
+
+    def reset(self, lstring: lpy.Lstring, derivation_steps: DerivationSteps):
+        """Continue derivation from `lstring` e.g. when restoring a simulation"""
+        self._keep(lstring)
+        self._derivation_step = int(derivation_steps[0])
+        nested = iter(derivation_steps[1:])
+        for lsystem in self._lsystems:
+            if type(lsystem) is Lsystems:
+                lsystem.reset(lstring, next(nested))
+
     def sceneInterpretation(self, lstring: Optional[lpy.Lstring] = None) -> pgl.Scene:
-        """Create PlantGl scene from last lsystem/lstring in list"""
-        return self._lsystems[-1].sceneInterpretation(self._lstrings[-1])
+        """Create PlantGl scene from last lsystem/lstring in list or from `lstring`"""
+        return self._lsystems[-1].sceneInterpretation(
+            self._lstrings[-1] if lstring is None else lstring
+        )
@@ -0,0 +1,194 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import dataclasses as dc
+
+import openalea.lpy as lpy
+import openalea.plantgl.all as pgl
+
+from .. import constants
+
+
+def _vector(vector: pgl.Vector3) -> Tuple[float, float, float]:
+    return (vector.x, vector.y, vector.z)
+
+
+def _quantize(value: Any, digits: Optional[int]) -> Any:
+    """`value` rounded to `digits` significant digits if it is a float"""
+    if digits is None or not isinstance(value, float):
+        return value
+    return float(f"{value:.{digits}g}")
+
+
+def _direction(vector: pgl.Vector3, digits: Optional[int]) -> Tuple[float, ...]:
+    """A unit vector rounded to `digits` decimals"""
+    if digits is None:
+        return _vector(vector)
+    return tuple(round(value, digits) for value in _vector(vector))
+
+
+def _version(metamer: Any, digits: Optional[int] = None) -> Tuple[Any, ...]:
+    """All fields of a metamer the interpretation depends on"""
+    return (
+        _quantize(metamer.radius, digits),
+        _quantize(metamer.length, digits),
+        _direction(metamer.hlu.heading, digits),
+        _direction(metamer.hlu.up, digits),
+        _quantize(metamer.phyllotactic_angle, digits),
+        metamer.leaf.state,
+        _quantize(metamer.leaf.mass, digits),
+        _quantize(metamer.leaf.lg, digits),
+        _quantize(metamer.leaf_area, digits),
+        metamer.fruit.state,
+        _quantize(metamer.fruit.mass, digits),
+        metamer.observation,
+        metamer.zone,
+        metamer.year,
+        (
+            _quantize(metamer.layers[-1].reaction_wood, digits)
+            if metamer.layers
+            else None
+        ),
+    )
+
+
+@dc.dataclass
+class _Entry:
+    metamer: Any
+    version: Tuple[Any, ...]
+    # shapes of the metamer interpreted at the origin
+    local: List[pgl.Shape] = dc.field(default_factory=lambda: list())
+    position: Optional[Tuple[float, float, float]] = None
+    shapes: List[pgl.Shape] = dc.field(default_factory=lambda: list())
+
+    def place(self, index: int, position: pgl.Vector3) -> List[pgl.Shape]:
+        """The shapes moved to `position` with the index of the module as id"""
+        if self.position != _vector(position):
+            self.position = _vector(position)
+            self.shapes = [
+                pgl.Shape(
+                    pgl.Translated(position, shape.geometry), shape.appearance, index
+                )
+                for shape in self.local
+            ]
+        else:
+            # e.g. a module was inserted before the metamer
+            for shape in self.shapes:
+                if shape.id != index:
+                    shape.id = index
+        return self.shapes
+
+
+class SceneCache:
+    """Assemble scenes from cached shapes of each metamer
+
+    A metamer is interpreted (at the origin) only if one of the fields its
+    interpretation depends on changed. All these metamers are interpreted in one
+    pass. The cached shapes are moved to the turtle position of the
+    metamer which is calculated by walking the lstring.
+
+    Like interpretation.lpy this assumes that only metamers move the turtle (by their
+    length along their heading) and that only metamers and the root are drawn. The
+    root is interpreted every time since it shows the date.
+
+    If `digits` is set the fields are compared rounded to `digits` significant digits
+    (the unit vectors of the orientation to `digits` decimals). A scene may then show
+    a metamer as it was up to a change of that size ago: e.g. with 3 digits its
+    length or radius may be off by 0.05 % and its direction by 0.001 rad. Positions
+    are always exact.
+
+    :param interpret: a function returning the scene of an lstring
+    :param digits: the precision of the comparison, exact if None
+    """
+
+    # number of metamers taken from the cache and interpreted since it was created
+    hits: int
+    misses: int
+    _interpret: Callable[[lpy.Lstring], pgl.Scene]
+    _entries: Dict[int, _Entry]
+    _context: Optional[Hashable]
+    _digits: Optional[int]
+
+    def __init__(
+        self,
+        interpret: Callable[[lpy.Lstring], pgl.Scene],
+        digits: Optional[int] = None,
+    ):
+        self.hits = 0
+        self.misses = 0
+        self._interpret = interpret
+        self._digits = digits
+        self._entries = {}
+        self._context = None
+
+    def _interpret_modules(self, entries: List[Tuple[Any, _Entry]]):
+        """Set the shapes of each module interpreted on its own at the origin
+
+        The modules are interpreted in a single lstring, each one in brackets. The id
+        of a shape is the index of the module it belongs to.
+        """
+        lstring = lpy.Lstring()
+        for module, _ in entries:
+            lstring.append(lpy.ParamModule("SB"))
+            lstring.append(module)
+            lstring.append(lpy.ParamModule("EB"))
+        for shape in self._interpret(lstring):
+            entries[shape.id // 3][1].local.append(shape)
+
+    def scene(self, lstring: lpy.Lstring, context: Hashable = None) -> pgl.Scene:
+        """The scene of `lstring`
+
+        :param lstring: the lstring to interpret
+        :param context: anything else the interpretation depends on e.g. the render
+            mode. All cached shapes are dropped if it changed.
+        """
+
+        if context != self._context:
+            self._entries = {}
+            self._context = context
+
+        entries: Dict[int, _Entry] = {}
+        # index, turtle position and entry of each module that is drawn
+        placements: List[Tuple[int, pgl.Vector3, _Entry]] = []
+        interpret: List[Tuple[Any, _Entry]] = []
+        position = pgl.Vector3(0.0, 0.0, 0.0)
+        stack = []
+        for i, module in enumerate(lstring):
+            name = module.name
+            if name in ("[", "SB"):
+                stack.append(position)
+            elif name in ("]", "EB"):
+                position = stack.pop()
+            elif name == "metamer":
+                metamer = module[0]
+                entry = self._entries.get(id(metamer))
+                version = _version(metamer, self._digits)
+                if (
+                    entry is None
+                    or entry.metamer is not metamer
+                    or entry.version != version
+                ):
+                    entry = _Entry(metamer, version)
+                    interpret.append((module, entry))
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                placements.append((i, position, entry))
+                entries[id(metamer)] = entry
+                position = position + metamer.hlu.heading * (
+                    metamer.length * constants.scene_scale
+                )
+            elif name == "root":
+                entry = _Entry(None, ())
+                interpret.append((module, entry))
+                placements.append((i, position, entry))
+
+        if interpret:
+            self._interpret_modules(interpret)
+        scene = pgl.Scene()
+        for i, position, entry in placements:
+            for shape in entry.place(i, position):
+                scene.add(shape)
+
+        # drop shapes of metamers that are gone
+        self._entries = entries
+
+        return scene
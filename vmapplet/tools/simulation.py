@@ -205,11 +205,13 @@ class Event(object):
         res += " active=" + str(self.active)
         return res
 
-    def isactive(self, date):
+    def isactive(self, date, days=1):
         """Check whether the event staring and ending time are spanning a
         given date.
 
         :param date: a :class:`datetime.datetime` instance
+        :param days: the number of days up to and including `date` to check. With
+            a time step of several days an event is active if it spans any of them.
 
         :returns: True if the event span the current date, e.g, if
             event.starting_date < date < event.ending_date
@@ -219,9 +221,20 @@ class Event(object):
         >>> event = Event('test', date, duration, periodic=False)
         >>> event.isactive(datetime.datetime(2000, 4, 19))
         True
+        >>> event = Event('test', date, datetime.timedelta(1), periodic=False)
+        >>> event.isactive(datetime.datetime(2000, 4, 20))
+        False
+        >>> event.isactive(datetime.datetime(2000, 4, 20), days=7)
+        True
 
         """
+        self._active = any(
+            self.spans(date - datetime.timedelta(day)) for day in range(max(1, days))
+        )
+        return self._active
 
+    def spans(self, date):
+        """Same as :meth:`isactive` without changing the :attr:`active` attribute"""
         assert type(date) is datetime.datetime
 
         # 2 cases: either the event is periodic and therefore occurs every year,
@@ -229,10 +242,7 @@ class Event(object):
 
         # non periodic case is simple:
         if self.periodic is False:
-            if self.ending_date >= date and self.starting_date <= date:
-                self._active = True
-            else:
-                self._active = False
+            return self.ending_date >= date and self.starting_date <= date
         else:
             # If periodic, we do not want to use the date as such, but we want
             # to switch to the same year as the event itself. One problem arise
@@ -247,11 +257,42 @@ class Event(object):
                         self.starting_date.year, date.month, date.day - 1
                     )
 
-            if self.ending_date >= newdate and self.starting_date <= newdate:
-                self._active = True
-            else:
-                self._active = False
-        return self._active
+            return self.ending_date >= newdate and self.starting_date <= newdate
+
+    def next_active_date(self, date):
+        """The first date (in days) after `date` on which the event is active
+
+        :param date: a :class:`datetime.datetime` instance
+
+        :returns: a :class:`datetime.datetime` instance or None if the event will
+            not be active anymore
+
+        >>> event = Event('test', datetime.datetime(2000, 4, 15), datetime.timedelta(10))
+        >>> event.next_active_date(datetime.datetime(2001, 4, 20))
+        datetime.datetime(2001, 4, 21, 0, 0)
+        >>> event.next_active_date(datetime.datetime(2001, 4, 25))
+        datetime.datetime(2002, 4, 15, 0, 0)
+
+        """
+        next_day = date + datetime.timedelta(1)
+        if self.spans(next_day):
+            return next_day
+
+        if self.periodic is False:
+            return self.starting_date if self.starting_date > date else None
+
+        year = date.year
+        while True:
+            try:
+                starting_date = datetime.datetime(
+                    year, self.starting_date.month, self.starting_date.day
+                )
+            except ValueError:
+                # event starting on February 29th
+                starting_date = datetime.datetime(year, 2, 28)
+            if starting_date > date:
+                return starting_date
+            year += 1
 
     def _set_duration(self, duration):
         self._duration = datetime.timedelta(days=duration)
@@ -386,6 +427,17 @@ class Events(object):
                 break
         del self.events[index]
 
+    def next_active_date(self, date):
+        """The first date after `date` on which any of the events is active
+
+        :param date: a :class:`datetime.datetime` instance
+
+        :returns: a :class:`datetime.datetime` instance or None
+        """
+        dates = [event.next_active_date(date) for event in self.events]
+        dates = [date for date in dates if date is not None]
+        return min(dates) if dates else None
+
     def _get_names(self):
         return [x.name for x in self.events]
 
@@ -561,7 +613,7 @@ class SimulationInterface(object):
             self._year_no += 1
 
         for event in self.events.events:
-            event.isactive(self.date)
+            event.isactive(self.date, self.dt.days)
 
         return new_year
 
@@ -569,7 +621,39 @@ class SimulationInterface(object):
 @dc.dataclass(frozen=True)
 class RotationConvergence:
     steps: int = 2  # Runge-Kutta order 2
+    # if > 0 the mechanics are derived until the maximum change of the rotation
+    # velocity of all metamers is below tolerance, at most maximum_steps times
+    tolerance: float = 0.0
+    maximum_steps: int = 10
+    # skip the mechanics if their inputs did not change and the rotation settled
+    skip_unchanged: bool = False
+
+    def __post_init__(self):
+        if self.steps < 1 or self.maximum_steps < 1:
+            raise ValueError(
+                "The convergence steps and maximum steps must be at least 1, got "
+                f"{self.steps} and {self.maximum_steps}"
+            )
 
     @property
     def step(self) -> float:
         return 1.0 / self.steps
+
+    @property
+    def adaptive(self) -> bool:
+        return self.tolerance > 0
+
+    @property
+    def tracks_change(self) -> bool:
+        return self.adaptive or self.skip_unchanged
+
+    @property
+    def settled_tolerance(self) -> float:
+        """Change of the rotation velocity below which the mechanics settled"""
+        return self.tolerance if self.adaptive else 1e-12
+
+    def relaxation(self, days: int = 1) -> float:
+        """The weight of the new rotation velocity after `days` daily steps"""
+        if days == 1:
+            return self.step
+        return 1.0 - (1.0 - self.step) ** days
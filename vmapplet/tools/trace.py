@@ -0,0 +1,63 @@
+from typing import Any, Dict, List, Union
+from collections import Counter
+from datetime import datetime
+import csv
+import io
+import json
+import os
+import pathlib
+
+import openalea.lpy as lpy
+
+# modules counted per derivation
+TRACE_MODULES = ("metamer", "apex", "growth_unit")
+TRACE_FIELDS = ("date", "lsystem", "seconds", "steps", "modules", *TRACE_MODULES)
+
+
+class Tracer:
+    """Collect wall time and lstring statistics of each lsystem derivation
+
+    Records are collected by :class:`~vmapplet.tools.lsystems.Lsystems` and written
+    once per time step with :meth:`write` to a JSONL or, if the file name ends with
+    `.csv`, a CSV file.
+    """
+
+    # wall time per lsystem since the tracer was created [s]
+    totals: Dict[str, float]
+    _records: List[Dict[str, Any]]
+
+    def __init__(self):
+        self.totals = {}
+        self._records = []
+
+    def record(self, lsystem: str, seconds: float, steps: int, lstring: lpy.Lstring):
+        self.totals[lsystem] = self.totals.get(lsystem, 0.0) + seconds
+        counts = Counter(module.name for module in lstring)
+        self._records.append(
+            dict(
+                lsystem=lsystem,
+                seconds=seconds,
+                steps=steps,
+                modules=len(lstring),
+                **{name: counts[name] for name in TRACE_MODULES},
+            )
+        )
+
+    def write(self, path: Union[str, pathlib.Path], date: datetime):
+        """Append the records collected since the last write"""
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        records = [dict(date=date.date().isoformat(), **r) for r in self._records]
+        self._records = []
+
+        if path.suffix == ".csv":
+            header = not path.exists() or os.path.getsize(path) == 0
+            with io.open(path, "a", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=TRACE_FIELDS)
+                if header:
+                    writer.writeheader()
+                writer.writerows(records)
+        else:
+            with io.open(path, "a") as file:
+                for record in records:
+                    file.write(json.dumps(record) + "\n")